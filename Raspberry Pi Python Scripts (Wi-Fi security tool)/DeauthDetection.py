@@ -1,13 +1,29 @@
 #!/usr/bin/env python3
-import sys, time, json
-from collections import Counter
-from scapy.all import sniff, Dot11Deauth
-from MQTTHelper import mqtt_helper, BLOCKED_BSSIDS  # Import the global instance and blocked dict
+import sys
+from collections import Counter, deque
+from operator import itemgetter
+from PacketCapture import CaptureFrames, RawFrameAddresses, DEAUTH_FILTER
+import MQTTHelper  # For MQTTHelper.DEBUG, read at call time so it can be switched on after import.
+from MQTTHelper import mqtt_helper, BLOCKED_BSSIDS, IsoTimestamp, PipePublisher  # Import the global instance and blocked dict
 
 # Dictionary to store records of de-auth frames for each destination MAC.
-# Key: Destination MAC; Value: list of tuples (Timestamp, Attacker MAC)
+# Key: Destination MAC; Value: deque of tuples (Timestamp, Attacker MAC), oldest first.
+# MACs in these dictionaries are the raw 6 bytes from the frame header; they are only
+# formatted as strings when an alert is published.
 DeauthRecords = {}
 
+# Dictionary to store a running count of frames per attacker inside the time window.
+# Key: Destination MAC; Value: Counter of Attacker MAC -> frames, kept in step with DeauthRecords.
+DeauthCounters = {}
+
+# Dictionary to store the attacker sending the most frames inside the window, tracked online so an
+# alert does not have to scan the counter. Key: Destination MAC; Value: tuple (Attacker MAC, Count).
+# The stored count is never below any attacker's current count. When the mode attacker's frames age
+# out of the window it may no longer be the mode, so the destination is added to StaleModes and the
+# mode is recomputed from the counter only when an alert actually needs it.
+DeauthModes = {}
+StaleModes = set()
+
 # Dictionary to store the maximum count of de-auth frames observed per destination.
 MaxDeauthCounts = {}
 
@@ -18,73 +34,139 @@ TimeWindow = 5        # Time window in seconds.
 # Dictionary to store the last alert time per destination (to update alerts at most once per second).
 LastAlertTime = {}
 
+# Eviction policy: every SweepInterval seconds, destinations whose window is empty and that have not
+# alerted for RecordRetention seconds are removed from all of the dictionaries above, so victims that
+# stop being attacked do not keep memory for the lifetime of the process.
+SweepInterval = 60      # Seconds between sweeps.
+RecordRetention = 300   # Seconds a quiet destination is kept after its last alert.
+LastSweepTime = 0
+
+def SweepStaleRecords(CurrentTime):
+    """Forget destinations that have gone quiet (see the eviction policy above)."""
+    for Destination, Records in list(DeauthRecords.items()):
+        if Records and CurrentTime - Records[-1][0] <= TimeWindow:
+            continue
+        if CurrentTime - LastAlertTime.get(Destination, 0) <= RecordRetention:
+            continue
+        del DeauthRecords[Destination]
+        DeauthCounters.pop(Destination, None)
+        DeauthModes.pop(Destination, None)
+        StaleModes.discard(Destination)
+        MaxDeauthCounts.pop(Destination, None)
+        LastAlertTime.pop(Destination, None)
+
 def PublishDeauthAlert(Destination, Count, AttackerMAC, MaxCount):
     """Publish a de-auth alert message over MQTT as a JSON payload."""
     AlertData = {
         "alert_type": "deauth_attack",
-        "destination": Destination,
+        "destination": Destination.hex(":"),
         "frame_count": Count,
         "max_frame_count": MaxCount,
-        "most_frequent_attacker": AttackerMAC,
+        "most_frequent_attacker": AttackerMAC.hex(":"),
         "spoofed": True,  # Indicates that the attacker MAC is likely spoofed.
         "time_window": TimeWindow,
-        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        "timestamp": IsoTimestamp()
     }
     mqtt_helper.publish("alerts/deauth", AlertData)
-    print("Published de-auth MQTT alert:", json.dumps(AlertData))
+    if MQTTHelper.DEBUG:
+        print("Published de-auth MQTT alert:", AlertData)
 
-def DetectDeauth(Pkt):
-    """Process de-authentication frames to count frames per destination and publish MQTT alerts when threshold is reached."""
-    if Pkt.haslayer(Dot11Deauth):
-        CurrentTime = time.time()
-        Destination = Pkt.addr1  # The victim's MAC address.
-        Attacker = Pkt.addr2     # The sender's (attacker's) MAC address.
-        
-        # Ignore frames from an attacker that was blocked less than 30 seconds ago.
-        if Attacker in BLOCKED_BSSIDS and (CurrentTime - BLOCKED_BSSIDS[Attacker] < 30):
+def DetectDeauth(Frame, CurrentTime):
+    """
+    Process a raw de-authentication frame to count frames per destination and publish MQTT alerts
+    when the threshold is reached. Only deauth frames reach this function (see DEAUTH_FILTER).
+    CurrentTime is the capture time of the frame's batch, shared by all frames read together.
+    """
+    global LastSweepTime
+    Destination, Attacker = RawFrameAddresses(Frame)  # The victim's and the sender's (attacker's) MAC addresses.
+    
+    # Periodically drop victims that are no longer being attacked. This runs on the capture thread,
+    # which is the only writer of the dictionaries, so no locking is needed.
+    if CurrentTime - LastSweepTime >= SweepInterval:
+        SweepStaleRecords(CurrentTime)
+        LastSweepTime = CurrentTime
+    
+    # Ignore frames from an attacker that was blocked less than 30 seconds ago.
+    # BLOCKED_BSSIDS is keyed by MAC string, so only format the attacker when something is blocked.
+    if BLOCKED_BSSIDS:
+        BlockedAt = BLOCKED_BSSIDS.get(Attacker.hex(":"))
+        if BlockedAt is not None and CurrentTime - BlockedAt < 30:
             return
-        
-        # Initialise record list for this victim if not present.
-        if Destination not in DeauthRecords:
-            DeauthRecords[Destination] = []
-        DeauthRecords[Destination].append((CurrentTime, Attacker))
-        
-        # Remove records older than TimeWindow seconds.
-        DeauthRecords[Destination] = [(T, A) for (T, A) in DeauthRecords[Destination] if CurrentTime - T <= TimeWindow]
-        Count = len(DeauthRecords[Destination])
-        
-        # Update maximum count for this destination.
-        if Destination not in MaxDeauthCounts or Count > MaxDeauthCounts[Destination]:
-            MaxDeauthCounts[Destination] = Count
-        
-        # If the count meets or exceeds the threshold, publish an alert (once per second per victim).
-        if Count >= Threshold:
-            AttackerList = [A for (T, A) in DeauthRecords[Destination]]
-            MostCommon = Counter(AttackerList).most_common(1)
-            AttackerMAC = MostCommon[0][0] if MostCommon else "Unknown"
-            if Destination not in LastAlertTime or (CurrentTime - LastAlertTime[Destination]) >= 1:
-                PublishDeauthAlert(Destination, Count, AttackerMAC, MaxDeauthCounts[Destination])
-                LastAlertTime[Destination] = CurrentTime
-        else:
-            # Clear stored alert time if count drops below threshold.
-            if Destination in LastAlertTime:
-                del LastAlertTime[Destination]
+    
+    # Initialise the sliding window for this victim if not present.
+    Records = DeauthRecords.setdefault(Destination, deque())
+    Counts = DeauthCounters.setdefault(Destination, Counter())
+    Records.append((CurrentTime, Attacker))
+    Counts[Attacker] += 1
+    AttackerCount = Counts[Attacker]
+    Mode = DeauthModes.get(Destination)
+    if Mode is None or AttackerCount > Mode[1]:
+        DeauthModes[Destination] = (Attacker, AttackerCount)
+        StaleModes.discard(Destination)
+    
+    # Remove records older than TimeWindow seconds, updating the counter incrementally.
+    while Records and CurrentTime - Records[0][0] > TimeWindow:
+        _, OldAttacker = Records.popleft()
+        Counts[OldAttacker] -= 1
+        if not Counts[OldAttacker]:
+            del Counts[OldAttacker]
+        if OldAttacker == DeauthModes[Destination][0]:
+            StaleModes.add(Destination)
+    Count = len(Records)
+    
+    # Update maximum count for this destination.
+    if Destination not in MaxDeauthCounts or Count > MaxDeauthCounts[Destination]:
+        MaxDeauthCounts[Destination] = Count
+    
+    # If the count meets or exceeds the threshold, publish an alert (once per second per victim).
+    if Count >= Threshold:
+        if Destination not in LastAlertTime or (CurrentTime - LastAlertTime[Destination]) >= 1:
+            if Destination in StaleModes:
+                DeauthModes[Destination] = max(Counts.items(), key=itemgetter(1))
+                StaleModes.discard(Destination)
+            AttackerMAC = DeauthModes[Destination][0]
+            PublishDeauthAlert(Destination, Count, AttackerMAC, MaxDeauthCounts[Destination])
+            LastAlertTime[Destination] = CurrentTime
+    else:
+        # Clear stored alert time if count drops below threshold.
+        if Destination in LastAlertTime:
+            del LastAlertTime[Destination]
+
+def ApplyCommands(CommandQueue):
+    """
+    Apply commands forwarded by the parent process when running as a detector process.
+    ("block", (BSSID, Timestamp)) records a rogue AP that the parent has just blocked.
+    """
+    while not CommandQueue.empty():
+        Name, Data = CommandQueue.get()
+        if Name == "block":
+            BSSID, BlockedAt = Data
+            BLOCKED_BSSIDS[BSSID] = BlockedAt
 
-def StartSniffing(Interface="wlan1"):
+def StartSniffing(Interface="wlan1", OnBatch=None):
     print(f"[*] Starting de-auth attack detection on interface: {Interface}")
     try:
-        # Run sniffing continuously (no timeout).
-        sniff(iface=Interface, prn=DetectDeauth, store=0)
+        # Capture continuously (no timeout); the kernel filter passes only deauth frames.
+        CaptureFrames(Interface, DEAUTH_FILTER, DetectDeauth, OnBatch)
     except KeyboardInterrupt:
         print("De-auth sniffing interrupted by user, stopping...")
     except Exception as E:
         print(f"Error while sniffing: {E}")
         sys.exit(1)
 
-def Main():
+def Main(AlertPipe=None, CommandQueue=None):
+    """
+    Run de-auth detection. When started as a separate process by Main.py, alerts are sent to the
+    parent over AlertPipe and block notifications arrive on CommandQueue.
+    """
+    global mqtt_helper
     Interface = sys.argv[1] if len(sys.argv) > 1 else "wlan1"
+    OnBatch = None
+    if AlertPipe is not None:
+        mqtt_helper = PipePublisher(AlertPipe)
+        OnBatch = lambda Now: ApplyCommands(CommandQueue)
     # Do not manage MQTT connection here; connection management is handled centrally.
-    StartSniffing(Interface=Interface)
+    StartSniffing(Interface=Interface, OnBatch=OnBatch)
 
 if __name__ == "__main__":
     Main()
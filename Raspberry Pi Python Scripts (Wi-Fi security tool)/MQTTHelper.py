@@ -1,10 +1,20 @@
 #!/usr/bin/env python3
 import paho.mqtt.client as mqtt
+import errno
 import json
+import socket
 import sys
 import threading
 import time  # Added import for time
-from scapy.all import RadioTap, Dot11, Dot11Deauth, sendp
+import traceback
+import asyncio
+from collections import deque
+from scapy.all import RadioTap, Dot11, Dot11Deauth
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the standard library encoder.
+    orjson = None
 
 # Global dictionary to record blocked BSSIDs with timestamps.
 BLOCKED_BSSIDS = {}
@@ -13,6 +23,17 @@ BLOCKED_BSSIDS = {}
 MQTT_BROKER = "localhost"  # For the Pi; external clients should use the Pi's static IP.
 MQTT_PORT = 1883
 
+# Queued alerts are coalesced and published as one JSON array per topic at this interval (seconds).
+BATCH_INTERVAL = 0.05
+# Maximum number of alerts held per topic between flushes; the oldest are dropped beyond this.
+MAX_QUEUED_ALERTS = 1000
+
+# Maximum number of QoS 1 messages awaiting PUBACK before paho queues further publishes.
+MAX_INFLIGHT_MESSAGES = 200
+
+# Set to True to log every published message (costly on the detection hot path).
+DEBUG = False
+
 # Topic hierarchy for alerts and commands.
 ALERT_TOPICS = {
     "rogue_ap": "alerts/rogue_ap",
@@ -26,6 +47,29 @@ COMMAND_TOPICS = {
     "run_assessment": "commands/run_assessment"
 }
 
+def EncodeJSON(Obj):
+    """Serialise Obj to compact JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(Obj)
+    return json.dumps(Obj, separators=(",", ":")).encode()
+
+def DecodeJSON(Raw):
+    """Parse JSON from bytes, using orjson when it is installed. Raises ValueError on invalid input."""
+    if orjson is not None:
+        return orjson.loads(Raw)
+    return json.loads(Raw)
+
+# Cached (second, ISO-8601 string) pair so the timestamp is formatted at most once per second.
+TimestampCache = (0, "")
+
+def IsoTimestamp():
+    """Return the current UTC time formatted as an ISO-8601 string (e.g. 2024-01-01T12:00:00Z)."""
+    global TimestampCache
+    Second = int(time.time())
+    if Second != TimestampCache[0]:
+        TimestampCache = (Second, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(Second)))
+    return TimestampCache[1]
+
 class MQTTHelper:
     def __init__(self, Broker=MQTT_BROKER, Port=MQTT_PORT):
         self.Broker = Broker
@@ -33,8 +77,19 @@ class MQTTHelper:
         self.Client = mqtt.Client()
         self.Client.on_connect = self.OnConnect
         self.Client.on_message = self.OnMessage
+        # Allow many unacknowledged QoS 1 alerts in flight instead of serialising on each PUBACK.
+        self.Client.max_inflight_messages_set(MAX_INFLIGHT_MESSAGES)
         # Dictionary to hold callbacks for specific topics.
         self.Callbacks = {}
+        # Alerts waiting for the next batched publish, keyed by (Topic, QoS).
+        self.PubQueue = {}
+        self.PubLock = threading.Lock()
+        self.FlushStop = threading.Event()
+        self.FlushThread = None
+        # Raw AF_PACKET sockets used to inject deauth frames, opened once per interface.
+        self.InjectSockets = {}
+        # Event loop used to run blocking assessments off the MQTT thread (set by Main.py when available).
+        self.Loop = None
         # Subscribe to block command and on-demand assessment commands.
         self.subscribe(COMMAND_TOPICS["block"], self.BlockCallback)
         self.subscribe(COMMAND_TOPICS["run_assessment"], self.RunAssessmentCallback)
@@ -44,6 +99,10 @@ class MQTTHelper:
         try:
             self.Client.connect(self.Broker, self.Port, 60)
             self.Client.loop_start()
+            # Start the background thread that publishes queued alerts in batches.
+            self.FlushStop.clear()
+            self.FlushThread = threading.Thread(target=self.FlushLoop, name="MQTTFlushThread", daemon=True)
+            self.FlushThread.start()
             print(f"[MQTTHelper] Connected to MQTT broker at {self.Broker}:{self.Port}")
         except Exception as E:
             print("[MQTTHelper] Failed to connect to MQTT broker:", E)
@@ -51,48 +110,102 @@ class MQTTHelper:
 
     def OnConnect(self, Client, Userdata, Flags, RC):
         print("[MQTTHelper] MQTT OnConnect callback, result code:", RC)
-        # Subscribe to any topics with registered callbacks, avoiding duplicate subscriptions.
-        for Topic in self.Callbacks:
-            if not hasattr(self, 'SubscribedTopics'):
-                self.SubscribedTopics = set()
-            if Topic not in self.SubscribedTopics:
-                self.Client.subscribe(Topic)
-                self.SubscribedTopics.add(Topic)
-                print(f"[MQTTHelper] Subscribed to topic: {Topic}")
+        # Disable Nagle's algorithm so small alert packets are sent without waiting to coalesce.
+        Sock = self.Client.socket()
+        if Sock is not None:
+            Sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Subscribe to every topic with a registered callback in a single SUBSCRIBE packet.
+        # This runs on each (re)connect because the broker does not keep clean-session subscriptions.
+        if self.Callbacks:
+            self.Client.subscribe([(Topic, 0) for Topic in self.Callbacks])
+            print(f"[MQTTHelper] Subscribed to topics: {', '.join(self.Callbacks)}")
 
     def OnMessage(self, Client, Userdata, Msg):
-        Payload = Msg.payload.decode()
-        print(f"[MQTTHelper] Received message on topic {Msg.topic}: {Payload}")
+        print(f"[MQTTHelper] Received message on topic {Msg.topic}")
         if Msg.topic in self.Callbacks:
+            # Parse the raw payload bytes directly; fall back to text for non-JSON payloads.
             try:
-                Data = json.loads(Payload)
-            except json.JSONDecodeError:
-                Data = Payload
+                Data = DecodeJSON(Msg.payload)
+            except ValueError:
+                Data = Msg.payload.decode('utf-8', 'ignore')
             self.Callbacks[Msg.topic](Data)
 
     def subscribe(self, Topic, Callback):
         """
-        Subscribe to a topic and register a callback to be executed when a message is received.
+        Register a callback to be executed when a message is received on a topic.
+        The SUBSCRIBE itself is sent from OnConnect, or straight away if already connected.
         """
-        self.Client.subscribe(Topic)
         self.Callbacks[Topic] = Callback
-        print(f"[MQTTHelper] Subscribed to topic: {Topic}")
+        if self.Client.is_connected():
+            self.Client.subscribe(Topic)
+            print(f"[MQTTHelper] Subscribed to topic: {Topic}")
 
-    def publish(self, Topic, Payload, QoS=1):
+    def publish(self, Topic, Payload, QoS=1, Immediate=False):
         """
-        Publish a payload to a topic. If the payload is a dictionary, it is converted to JSON.
+        Publish a payload to a topic. If the payload is a dictionary, it is encoded to JSON bytes;
+        bytes payloads are sent as-is.
+        By default the payload is queued and sent together with any other alerts for the same topic
+        as a single JSON array on '<Topic>/batch' at the next flush. Pass Immediate=True to publish
+        it on its own straight away (e.g. for one-off assessment results).
         """
         if isinstance(Payload, dict):
-            Payload = json.dumps(Payload)
-        self.Client.publish(Topic, Payload, qos=QoS)
-        print(f"[MQTTHelper] Published to {Topic}: {Payload}")
+            Payload = EncodeJSON(Payload)
+        elif isinstance(Payload, str):
+            Payload = Payload.encode()
+        if Immediate:
+            self.Client.publish(Topic, Payload, qos=QoS)
+            if DEBUG:
+                print(f"[MQTTHelper] Published to {Topic}: {Payload.decode(errors='replace')}")
+            return
+        with self.PubLock:
+            if (Topic, QoS) not in self.PubQueue:
+                self.PubQueue[(Topic, QoS)] = deque(maxlen=MAX_QUEUED_ALERTS)
+            self.PubQueue[(Topic, QoS)].append(Payload)
+
+    def publish_telemetry(self, Topic, Payload, Immediate=False):
+        """
+        Publish non-critical, informational data (e.g. unrecognised SSID lists) with QoS 0,
+        skipping the PUBACK round trip. Otherwise behaves like publish().
+        """
+        self.publish(Topic, Payload, QoS=0, Immediate=Immediate)
+
+    def flush(self):
+        """
+        Publish all queued alerts, one JSON array per topic on '<Topic>/batch'.
+        """
+        with self.PubLock:
+            Pending, self.PubQueue = self.PubQueue, {}
+        for (Topic, QoS), Batch in Pending.items():
+            self.Client.publish(Topic + "/batch", b"[" + b",".join(Batch) + b"]", qos=QoS)
+            if DEBUG:
+                print(f"[MQTTHelper] Published batch of {len(Batch)} to {Topic}/batch")
+
+    def FlushLoop(self):
+        """Flush queued alerts every BATCH_INTERVAL seconds until disconnect() is called."""
+        while not self.FlushStop.wait(BATCH_INTERVAL):
+            self.flush()
 
     def disconnect(self):
+        # Stop the flush thread and send anything still queued before closing the connection.
+        self.FlushStop.set()
+        if self.FlushThread is not None:
+            self.FlushThread.join()
+        self.flush()
         self.Client.loop_stop()
         self.Client.disconnect()
         print("[MQTTHelper] Disconnected from MQTT broker.")
 
     # ---------------- Block Rogue AP Functionality ---------------- #
+    def GetInjectSocket(self, Iface):
+        """Return the raw injection socket for Iface, opening and caching it on first use."""
+        Sock = self.InjectSockets.get(Iface)
+        if Sock is None:
+            # Protocol 0: the socket is only used for sending and never queues received frames.
+            Sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+            Sock.bind((Iface, 0))
+            self.InjectSockets[Iface] = Sock
+        return Sock
+
     def BlockRogueAP(self, RogueBSSID, Iface="wlan1", Count=10):
         """
         Sends deauthentication frames to block a rogue AP.
@@ -102,12 +215,28 @@ class MQTTHelper:
           Iface: The monitor-mode interface to use (default "wlan1").
           Count: The number of deauth frames to send (default 10).
         """
-        # Construct the deauth frame; broadcast the deauth to all clients.
-        Pkt = RadioTap() / Dot11(addr1="ff:ff:ff:ff:ff:ff",
-                                  addr2=RogueBSSID,
-                                  addr3=RogueBSSID) / Dot11Deauth(reason=7)
-        sendp(Pkt, iface=Iface, count=Count, inter=0.1)
-        print(f"[MQTTHelper] Sent {Count} deauth frames to block rogue AP {RogueBSSID} on interface {Iface}")
+        # Construct the deauth frame once; broadcast the deauth to all clients.
+        Raw = bytes(RadioTap() / Dot11(addr1="ff:ff:ff:ff:ff:ff",
+                                       addr2=RogueBSSID,
+                                       addr3=RogueBSSID) / Dot11Deauth(reason=7))
+        # Send the frames back to back on the cached raw socket.
+        Sent = 0
+        try:
+            Sock = self.GetInjectSocket(Iface)
+            for _ in range(Count):
+                try:
+                    Sock.send(Raw)
+                except OSError as E:
+                    if E.errno != errno.ENOBUFS:
+                        raise
+                    # The driver's TX queue is full; give it a moment to drain, then retry once.
+                    time.sleep(0.001)
+                    Sock.send(Raw)
+                Sent += 1
+        except OSError as E:
+            # Stop the burst rather than letting the error reach paho's network thread.
+            print(f"[MQTTHelper] Sending deauth frames on {Iface} failed: {E}")
+        print(f"[MQTTHelper] Sent {Sent} of {Count} deauth frames to block rogue AP {RogueBSSID} on interface {Iface}")
         # Record that this rogue BSSID was blocked just now.
         global BLOCKED_BSSIDS
         BLOCKED_BSSIDS[RogueBSSID] = time.time()
@@ -130,6 +259,45 @@ class MQTTHelper:
             print("[MQTTHelper] Block command received but no 'target_bssid' provided.")
 
     # ---------------- On-Demand Assessment Functionality ---------------- #
+    @staticmethod
+    def RunGuarded(Target, Name):
+        """
+        Run Target, logging anything it raises instead of letting it propagate.
+        SystemExit is caught as well (PasswordAssessment exits when no Wi-Fi has been configured yet), so a
+        failed assessment only ends itself and never escapes into Main.py's event loop.
+        """
+        try:
+            Target()
+        except SystemExit as E:
+            print(f"[MQTTHelper] {Name} exited with status {E.code}")
+        except BaseException:
+            print(f"[MQTTHelper] {Name} failed:")
+            traceback.print_exc()
+
+    @staticmethod
+    def LogAssessmentFailure(Future, Name):
+        """Done-callback for an assessment future: report an exception that RunGuarded did not handle."""
+        if not Future.cancelled() and Future.exception() is not None:
+            print(f"[MQTTHelper] {Name} failed: {Future.exception()!r}")
+
+    def RunInBackground(self, Target, Name):
+        """
+        Run a blocking assessment without holding up the MQTT network thread.
+        Uses asyncio.to_thread on the registered event loop, or a new thread if no loop is running.
+        """
+        Loop = self.Loop
+        if Loop is not None and Loop.is_running():
+            Coroutine = asyncio.to_thread(self.RunGuarded, Target, Name)
+            try:
+                Future = asyncio.run_coroutine_threadsafe(Coroutine, Loop)
+            except RuntimeError:
+                # The loop closed after the check above.
+                Coroutine.close()
+            else:
+                Future.add_done_callback(lambda Future: self.LogAssessmentFailure(Future, Name))
+                return
+        threading.Thread(target=self.RunGuarded, args=(Target, Name), name=Name).start()
+
     def RunAssessmentCallback(self, Data):
         """
         Callback for the 'commands/run_assessment' topic.
@@ -139,23 +307,40 @@ class MQTTHelper:
         assessment_type = Data.get("assessment_type", "").lower()
         if assessment_type == "protocol":
             print("[MQTTHelper] Run assessment command received: Protocol")
-            # Launch the protocol assessment in a separate thread.
+            # Launch the protocol assessment in the background.
             try:
                 from ProtocolAssessment import Main as ProtocolAssessmentMain
-                threading.Thread(target=ProtocolAssessmentMain, name="ProtocolAssessmentThread").start()
+                self.RunInBackground(ProtocolAssessmentMain, "ProtocolAssessmentThread")
             except Exception as e:
                 print(f"[MQTTHelper] Error starting Protocol Assessment: {e}")
         elif assessment_type == "password":
             print("[MQTTHelper] Run assessment command received: Password")
-            # Launch the password assessment in a separate thread.
+            # Launch the password assessment in the background.
             try:
                 from PasswordAssessment import Main as PasswordAssessmentMain
-                threading.Thread(target=PasswordAssessmentMain, name="PasswordAssessmentThread").start()
+                self.RunInBackground(PasswordAssessmentMain, "PasswordAssessmentThread")
             except Exception as e:
                 print(f"[MQTTHelper] Error starting Password Assessment: {e}")
         else:
             print("[MQTTHelper] Unknown assessment type received:", assessment_type)
 
+class PipePublisher:
+    """
+    Stand-in for mqtt_helper inside a detector process started by Main.py.
+    Payloads are JSON-encoded here and sent over a one-way multiprocessing pipe to the parent process,
+    where the shared MQTTHelper publishes (and batches) them.
+    """
+    def __init__(self, Conn):
+        self.Conn = Conn
+
+    def publish(self, Topic, Payload, QoS=1, Immediate=False):
+        if isinstance(Payload, dict):
+            Payload = EncodeJSON(Payload)
+        self.Conn.send((Topic, Payload, QoS, Immediate))
+
+    def publish_telemetry(self, Topic, Payload, Immediate=False):
+        self.publish(Topic, Payload, QoS=0, Immediate=Immediate)
+
 # Global instance for use in other modules.
 mqtt_helper = MQTTHelper()
 
@@ -5,13 +5,19 @@ Main control script for the Wi‑Fi Security Assessment Tool.
 This central programme performs the following functions:
   - Connects to the MQTT broker once at startup.
   - Starts the Wi‑Fi configuration REST API (from WiFiAPI) so that the phone app can send Wi‑Fi credentials.
-  - Launches continuous monitoring modules (Rogue AP detection and De‑auth attack detection) on dedicated interfaces.
+  - Launches continuous monitoring modules (Rogue AP detection and De‑auth attack detection) on dedicated interfaces,
+    each in its own process so that their per-frame work runs on separate CPU cores.
   - Relies on the global MQTT helper (mqtt_helper) to manage all MQTT messaging, including on‑demand assessment commands.
+    Alerts raised in the detector processes are sent back to this process over pipes and published from here.
+  - Supervises the detector processes and forwards their alerts from a single asyncio event loop on the main thread.
 
 When a phone app command (e.g. "run_assessment" for protocol or password assessments) is received via MQTT,
-the MQTT helper spawns the corresponding assessment module in a new thread.
+the MQTT helper runs the corresponding assessment module in the event loop's worker threads (asyncio.to_thread),
+or in a plain thread once the loop has stopped.
 """
 
+import asyncio
+import multiprocessing as mp
 import threading
 import time
 
@@ -23,12 +29,12 @@ import RogueAPDetection
 import DeauthDetection
 
 # Import the global MQTT helper instance.
-from MQTTHelper import mqtt_helper
+from MQTTHelper import mqtt_helper, BLOCKED_BSSIDS, COMMAND_TOPICS
 
 def RunWiFiAPI():
     """
     Run the Wi‑Fi configuration REST API.
-    
+
     The REST API listens on all interfaces (0.0.0.0) over HTTPS, using a self‑signed certificate and key.
     The phone app sends Wi‑Fi credentials to this API, and the Pi uses nmcli to connect its built‑in Wi‑Fi (wlan0)
     to the selected network.
@@ -36,50 +42,117 @@ def RunWiFiAPI():
     WiFiAPIApp.run(
         host="0.0.0.0",
         port=5000,
+        threaded=True,  # Serve requests (e.g. job status polls) concurrently.
         ssl_context=(
             '/home/ismail/wifi-security-tool/data/cert.pem',
             '/home/ismail/wifi-security-tool/data/key.pem'
         )
     )
 
-def RunRogueAPDetection():
+def RunRogueAPDetection(AlertPipe, CommandQueue):
+    """
+    Start the Rogue AP detection module (in its own process).
+
+    This module continuously sniffs for beacon frames on the monitor interface (wlan1) and sends alerts
+    for any detected rogue access points over AlertPipe. Trusted network updates arrive on CommandQueue.
+    """
+    RogueAPDetection.Main(AlertPipe, CommandQueue)
+
+def RunDeauthDetection(AlertPipe, CommandQueue):
+    """
+    Start the De‑auth attack detection module (in its own process).
+
+    This module continuously monitors for de‑authentication frames and sends alerts over AlertPipe when the
+    threshold is exceeded. Notifications of newly blocked BSSIDs arrive on CommandQueue.
+    """
+    DeauthDetection.Main(AlertPipe, CommandQueue)
+
+def StartDetector(Target, Name, CommandQueue):
+    """
+    Start a detector process. Returns the process and the receiving end of its alert pipe.
+    """
+    AlertReader, AlertWriter = mp.Pipe(duplex=False)
+    Process = mp.Process(target=Target, args=(AlertWriter, CommandQueue), name=Name, daemon=True)
+    Process.start()
+    # Only the child writes alerts; closing our copy lets the reader see EOF if the child exits.
+    AlertWriter.close()
+    return Process, AlertReader
+
+def ForwardAlerts(Loop, AlertReader):
     """
-    Start the Rogue AP detection module.
-    
-    This module continuously sniffs for beacon frames on the monitor interface (wlan1) and publishes MQTT alerts
-    for any detected rogue access points.
+    Publish every alert waiting on AlertReader through the central MQTT helper.
+    Called by the event loop whenever the pipe is readable.
     """
-    RogueAPDetection.Main()
+    try:
+        while AlertReader.poll():
+            Topic, Payload, QoS, Immediate = AlertReader.recv()
+            mqtt_helper.publish(Topic, Payload, QoS=QoS, Immediate=Immediate)
+    except EOFError:
+        # The detector process has exited.
+        Loop.remove_reader(AlertReader.fileno())
 
-def RunDeauthDetection():
+async def Supervise(Detectors):
     """
-    Start the De‑auth attack detection module.
-    
-    This module continuously monitors for de‑authentication frames and publishes MQTT alerts when the threshold is exceeded.
+    Forward alerts from the detector processes and wait until all of them have exited.
+    Detectors is a list of (process, alert pipe reader) pairs.
     """
-    DeauthDetection.Main()
+    Loop = asyncio.get_running_loop()
+    # Let the MQTT helper run blocking assessments on this loop's worker threads.
+    mqtt_helper.Loop = Loop
+    try:
+        Exits = []
+        for Process, AlertReader in Detectors:
+            Loop.add_reader(AlertReader.fileno(), ForwardAlerts, Loop, AlertReader)
+            # A process's sentinel becomes readable when it exits.
+            Exited = Loop.create_future()
+            def OnExit(Process=Process, Exited=Exited):
+                Loop.remove_reader(Process.sentinel)
+                Exited.set_result(Process.exitcode)
+            Loop.add_reader(Process.sentinel, OnExit)
+            Exits.append(Exited)
+        await asyncio.gather(*Exits)
+    finally:
+        # The loop closes once the detectors have exited; later assessments fall back to plain threads.
+        mqtt_helper.Loop = None
 
 def Main():
+    # Each detector process has its own queue for commands that change its state.
+    RogueCommands = mp.SimpleQueue()
+    DeauthCommands = mp.SimpleQueue()
+
+    # Start the detector processes before any other thread exists, so that (with the fork start
+    # method) the children do not inherit locks held by the MQTT or REST API threads.
+    Detectors = [
+        StartDetector(RunRogueAPDetection, "RogueAPDetectionProcess", RogueCommands),
+        StartDetector(RunDeauthDetection, "DeauthDetectionProcess", DeauthCommands),
+    ]
+
+    # Trusted network updates are applied inside the rogue AP detection process.
+    mqtt_helper.subscribe(COMMAND_TOPICS["update_trusted"],
+                          lambda Data: RogueCommands.put(("update_trusted", Data)))
+
+    def BlockAndForward(Data):
+        """Block the rogue AP from this process, then tell de-auth detection to ignore its frames."""
+        mqtt_helper.BlockCallback(Data)
+        TargetBSSID = Data.get("target_bssid")
+        if TargetBSSID in BLOCKED_BSSIDS:
+            DeauthCommands.put(("block", (TargetBSSID, BLOCKED_BSSIDS[TargetBSSID])))
+    mqtt_helper.subscribe(COMMAND_TOPICS["block"], BlockAndForward)
+
     # Connect to the MQTT broker once, centrally.
     mqtt_helper.connect()
-    
-    # Create threads for each of the core services.
+
+    # Create a thread for the REST API (served by Flask's own threaded server).
     WiFiAPIThread = threading.Thread(target=RunWiFiAPI, name="WiFiAPIThread")
-    RogueAPDetectionThread = threading.Thread(target=RunRogueAPDetection, name="RogueAPDetectionThread")
-    DeauthDetectionThread = threading.Thread(target=RunDeauthDetection, name="DeauthDetectionThread")
-    
-    # Start all threads.
     WiFiAPIThread.start()
-    RogueAPDetectionThread.start()
-    DeauthDetectionThread.start()
-    
+
     print("[Main] All core services have started. The system is operational.")
-    
+
     try:
-        # Keep the main thread alive by joining the worker threads.
+        # Forward alerts and supervise the detector processes on the main thread, then keep the
+        # main process alive by joining the REST API thread.
+        asyncio.run(Supervise(Detectors))
         WiFiAPIThread.join()
-        RogueAPDetectionThread.join()
-        DeauthDetectionThread.join()
     except KeyboardInterrupt:
         print("Received KeyboardInterrupt, shutting down...")
     finally:
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Lightweight raw 802.11 capture shared by the continuous detection modules.
+
+Frames are read straight from an AF_PACKET socket bound to the monitor-mode interface.
+A classic BPF program is attached in the kernel so that only the management subtypes a
+detector cares about are ever copied to userspace, and the handler receives the raw RadioTap +
+802.11 bytes so header fields can be read at fixed offsets instead of dissecting every
+frame with Scapy.
+"""
+import ctypes, socket, struct, time
+
+ETH_P_ALL = 0x0003
+SO_ATTACH_FILTER = getattr(socket, "SO_ATTACH_FILTER", 26)
+
+# First Frame Control byte (type and subtype bits, protocol version masked off) of each frame kind.
+FC_BEACON = 0x80  # Management, subtype 8.
+FC_DEAUTH = 0xC0  # Management, subtype 12.
+FC_TYPE_MASK = 0xFC
+
+# Kernel filters for the frame types each detector needs: the Frame Control values to accept.
+DEAUTH_FILTER = (FC_DEAUTH,)
+BEACON_FILTER = (FC_BEACON,)
+
+# Kernel receive buffer for the capture socket (bytes). The default is easily overrun during floods.
+RECV_BUFFER_SIZE = 8 * 1024 * 1024
+SO_RCVBUFFORCE = getattr(socket, "SO_RCVBUFFORCE", 33)
+
+# Largest frame read from the socket; management frames are well below this.
+MAX_FRAME_SIZE = 4096
+# Maximum number of queued frames handled per batch; every frame in a batch shares one clock reading.
+BATCH_SIZE = 128
+
+# Length of the 802.11 management header (frame control, duration, three addresses, sequence).
+MGMT_HEADER_LEN = 24
+# Fixed beacon parameters (timestamp, beacon interval, capability info) preceding the tagged elements.
+BEACON_FIXED_LEN = 12
+
+def BuildFilter(FrameTypes):
+    """
+    Build a classic BPF program that accepts frames whose first Frame Control byte, masked with
+    FC_TYPE_MASK, is one of FrameTypes, and drops everything else in the kernel.
+    The RadioTap header length is variable, so it is read from bytes 2-3 into the index register
+    and the Frame Control byte is loaded relative to it.
+    """
+    Program = [
+        (0x30, 0, 0, 3),             # ldb [3]
+        (0x64, 0, 0, 8),             # lsh #8
+        (0x07, 0, 0, 0),             # tax
+        (0x30, 0, 0, 2),             # ldb [2]
+        (0x4c, 0, 0, 0),             # or x
+        (0x07, 0, 0, 0),             # tax            ; X = RadioTap length
+        (0x50, 0, 0, 0),             # ldb [x + 0]    ; Frame Control
+        (0x54, 0, 0, FC_TYPE_MASK),  # and #0xfc
+    ]
+    for Index, FrameType in enumerate(FrameTypes):
+        # jeq #FrameType, accept (skipping the remaining comparisons and the drop).
+        Program.append((0x15, len(FrameTypes) - Index, 0, FrameType))
+    Program.append((0x06, 0, 0, 0))               # ret #0         ; drop
+    Program.append((0x06, 0, 0, MAX_FRAME_SIZE))  # ret #snaplen   ; accept
+    return Program
+
+def AttachFilter(Sock, FrameTypes):
+    """Attach the BuildFilter(FrameTypes) program to Sock with SO_ATTACH_FILTER."""
+    Program = BuildFilter(FrameTypes)
+    # struct sock_filter { __u16 code; __u8 jt; __u8 jf; __u32 k; }
+    Instructions = ctypes.create_string_buffer(b"".join(struct.pack("HBBI", *Insn) for Insn in Program))
+    # struct sock_fprog { unsigned short len; struct sock_filter *filter; }
+    Sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER,
+                    struct.pack("HP", len(Program), ctypes.addressof(Instructions)))
+
+def OpenMonitorSocket(Interface, Filter):
+    """
+    Open a raw AF_PACKET socket on Interface with a kernel filter accepting the Frame Control
+    values in Filter. The filter is attached before binding so no unfiltered frames are queued.
+    """
+    Sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+    try:
+        Sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, RECV_BUFFER_SIZE)
+    except OSError:
+        # Not running as root; the kernel caps this value at net.core.rmem_max.
+        Sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_SIZE)
+    AttachFilter(Sock, Filter)
+    Sock.bind((Interface, ETH_P_ALL))
+    return Sock
+
+def RadioTapLength(Frame):
+    """Return the length of the RadioTap header (little-endian, bytes 2-3)."""
+    return Frame[2] | (Frame[3] << 8)
+
+def RawFrameAddresses(Frame):
+    """
+    Return (addr1, addr2) of the 802.11 header as raw 6-byte values.
+    Cheaper than FrameAddresses for per-frame bookkeeping; format with .hex(":") only when needed.
+    """
+    Offset = RadioTapLength(Frame)
+    return Frame[Offset + 4:Offset + 10], Frame[Offset + 10:Offset + 16]
+
+def FrameAddresses(Frame):
+    """Return (addr1, addr2) of the 802.11 header as lowercase colon-separated MAC strings."""
+    Destination, Source = RawFrameAddresses(Frame)
+    return Destination.hex(":"), Source.hex(":")
+
+def BeaconSSID(Frame):
+    """
+    Walk the tagged elements of a beacon frame and return the raw SSID bytes,
+    or None if the frame does not carry a well-formed SSID element.
+    """
+    Offset = RadioTapLength(Frame) + MGMT_HEADER_LEN + BEACON_FIXED_LEN
+    End = len(Frame)
+    while Offset + 2 <= End:
+        ElementID = Frame[Offset]
+        Length = Frame[Offset + 1]
+        if Offset + 2 + Length > End:
+            return None
+        if ElementID == 0:
+            return Frame[Offset + 2:Offset + 2 + Length]
+        Offset += 2 + Length
+    return None
+
+def CaptureFrames(Interface, Filter, Handler, OnBatch=None):
+    """
+    Capture frames matching Filter on Interface and call Handler(Frame, Now) for each raw frame.
+    Frames are read in batches: the first recv blocks, then up to BATCH_SIZE - 1 already-queued
+    frames are drained without blocking, and the whole batch is stamped with a single time.time().
+    If given, OnBatch(Now) is called once per batch before its frames are handled.
+    Runs until interrupted; frames too short to hold an 802.11 management header are skipped.
+    """
+    Sock = OpenMonitorSocket(Interface, Filter)
+    try:
+        while True:
+            Batch = [Sock.recv(MAX_FRAME_SIZE)]
+            try:
+                while len(Batch) < BATCH_SIZE:
+                    Batch.append(Sock.recv(MAX_FRAME_SIZE, socket.MSG_DONTWAIT))
+            except BlockingIOError:
+                pass
+            Now = time.time()
+            if OnBatch is not None:
+                OnBatch(Now)
+            for Frame in Batch:
+                if len(Frame) < 4 or len(Frame) < RadioTapLength(Frame) + MGMT_HEADER_LEN:
+                    continue
+                Handler(Frame, Now)
+    finally:
+        Sock.close()
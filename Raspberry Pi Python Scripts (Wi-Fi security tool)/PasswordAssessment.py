@@ -1,14 +1,22 @@
 #!/usr/bin/env python3
-import re
 import os
+import string
 import sys
 import json
 import time
 from MQTTHelper import mqtt_helper  # Import the global instance
 
+# Character classes checked by AssessComplexity.
+LowercaseChars = frozenset(string.ascii_lowercase)
+UppercaseChars = frozenset(string.ascii_uppercase)
+DigitChars = frozenset(string.digits)
+SpecialChars = frozenset("!@#$%^&*(),.?\":{}|<>")
+
 def AssessComplexity(PSK):
     Score = 0
     Recommendations = []
+    # Collect the distinct characters once; each class check below is then a set test.
+    Chars = frozenset(PSK)
     
     # Check length.
     if len(PSK) >= 16:
@@ -19,25 +27,25 @@ def AssessComplexity(PSK):
         Recommendations.append("Increase password length (at least 12–16 characters).")
     
     # Check for lowercase letters.
-    if re.search(r"[a-z]", PSK):
+    if not LowercaseChars.isdisjoint(Chars):
         Score += 1
     else:
         Recommendations.append("Include lowercase letters.")
     
     # Check for uppercase letters.
-    if re.search(r"[A-Z]", PSK):
+    if not UppercaseChars.isdisjoint(Chars):
         Score += 1
     else:
         Recommendations.append("Include uppercase letters.")
     
     # Check for digits.
-    if re.search(r"\d", PSK):
+    if not DigitChars.isdisjoint(Chars):
         Score += 1
     else:
         Recommendations.append("Include numbers.")
     
     # Check for special characters.
-    if re.search(r"[!@#$%^&*(),.?\":{}|<>]", PSK):
+    if not SpecialChars.isdisjoint(Chars):
         Score += 1
     else:
         Recommendations.append("Include special characters (e.g., !@#$%^&*).")
@@ -101,7 +109,7 @@ def Main():
     
     # Publish the result to the 'alerts/password_assessment' topic using the global MQTT helper.
     Payload = json.dumps(Result)
-    mqtt_helper.publish("alerts/password_assessment", Payload)
+    mqtt_helper.publish("alerts/password_assessment", Payload, Immediate=True)
     print("Published password assessment via MQTT:", Payload)
     
     # Allow a short delay for the MQTT message to be sent.
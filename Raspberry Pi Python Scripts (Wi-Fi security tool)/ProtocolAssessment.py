@@ -1,9 +1,17 @@
 #!/usr/bin/env python3
-import subprocess, csv, os, sys, time, re, json
+import subprocess, csv, os, sys, time, json
 from MQTTHelper import mqtt_helper  # Import the global instance
 
-# Precompile a regex to match a MAC address.
-MacRegex = re.compile(r'^([0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}$')
+HexDigits = frozenset("0123456789abcdefABCDEF")
+
+def IsMAC(Value):
+    """
+    Return True if Value is a colon-separated MAC address (e.g. AA:BB:CC:DD:EE:FF).
+    Checks the length and the fixed colon positions before looking at the hex digits.
+    """
+    return (len(Value) == 17
+            and Value[2] == Value[5] == Value[8] == Value[11] == Value[14] == ":"
+            and HexDigits.issuperset(Value.replace(":", "")))
 
 def NormaliseSSID(SSID):
     """
@@ -15,16 +23,20 @@ def ParseCSV(CSVFilename):
     """
     Parse the given CSV file and return a dictionary of networks.
     Each network key is the ESSID, with a value dictionary containing Privacy, Cipher, and Authentication.
+    Parsing stops at the station section, which follows the access point rows in airodump-ng output.
     """
     Networks = {}
     with open(CSVFilename, newline='', encoding='utf-8', errors='ignore') as CSVFile:
         Reader = csv.reader(CSVFile)
         for Row in Reader:
             # Skip rows that don't have the expected columns.
-            if not Row or len(Row) < 14:
+            if not Row:
                 continue
             FirstCol = Row[0].strip()
-            if not MacRegex.match(FirstCol):
+            # Everything after the station header describes clients, not access points.
+            if FirstCol == "Station MAC":
+                break
+            if len(Row) < 14 or not IsMAC(FirstCol):
                 continue
             BSSID = FirstCol
             Channel = Row[3].strip()
@@ -73,10 +85,11 @@ def RunAirodump(Interface, Timeout):
             os.remove(Filename)
     print(f"[*] Running airodump-ng on channel 6 for {Timeout} seconds...")
     try:
+        # Results are read from the CSV file, so airodump-ng's live screen output is discarded.
         subprocess.run([
             "sudo", "airodump-ng", "-w", CapturePrefix, "--output-format", "csv",
             "-c", "6", Interface
-        ], timeout=Timeout+5)
+        ], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=Timeout+5)
     except subprocess.TimeoutExpired:
         print("[*] Airodump-ng capture complete.")
 
@@ -113,7 +126,7 @@ def Main():
         
         # Publish the summary via MQTT using the global instance.
         Payload = json.dumps(Summary)
-        mqtt_helper.publish("alerts/protocol_assessment", Payload, QoS=1)
+        mqtt_helper.publish("alerts/protocol_assessment", Payload, QoS=1, Immediate=True)
         print("Published protocol assessment via MQTT:", Payload)
     else:
         print("[ERROR] No networks found in the CSV output.")
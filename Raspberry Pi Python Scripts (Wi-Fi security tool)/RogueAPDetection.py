@@ -1,17 +1,80 @@
 #!/usr/bin/env python3
-import sys, json
-from scapy.all import sniff, Dot11, Dot11Beacon, Dot11Elt
-from MQTTHelper import mqtt_helper  # Use the global instance
+import sys, json, time
+from collections import OrderedDict
+from functools import lru_cache
+from PacketCapture import CaptureFrames, FrameAddresses, BeaconSSID, BEACON_FILTER
+import MQTTHelper  # For MQTTHelper.DEBUG, read at call time so it can be switched on after import.
+from MQTTHelper import mqtt_helper, PipePublisher  # Use the global instance
 
 # Initialise trusted networks as empty dictionaries.
-# Personal trusted networks will store full BSSID lists.
+# Personal trusted networks will store full BSSID sets.
 PersonalTrusted = {}
 # Public trusted networks will store only the BSSID prefix (first three octets).
 PublicTrusted = {}
+# Distinct lengths of the public SSIDs, longest first, for prefix (alias) matching.
+PublicSSIDLengths = ()
+# Flat set of (SSID, BSSID) pairs from PersonalTrusted for a single membership test per beacon.
+TrustedPersonalPairs = frozenset()
+
+class ExpiringSet:
+    """
+    A size-bounded set whose members expire, used so long-running sniffing does not grow without limit.
+    Eviction policy: an entry is dropped once it has not been refreshed for TTL seconds, and when more
+    than MaxSize entries are held the least recently refreshed one is dropped first.
+    Re-adding an entry only refreshes it once it is older than RefreshAge, so an SSID beaconed many times
+    a second costs a single dictionary lookup; it may expire up to TTL - RefreshAge seconds after it was
+    last seen.
+    """
+    def __init__(self, MaxSize=10000, TTL=3600, RefreshAge=3000):
+        self.MaxSize = MaxSize
+        self.TTL = TTL
+        self.RefreshAge = RefreshAge
+        # Key -> time it was last refreshed, least recently refreshed first.
+        self.Entries = OrderedDict()
+        # Time passed to the last expiry sweep, so frames sharing a batch time sweep only once.
+        self.LastExpired = None
+
+    def add(self, Key, Now=None):
+        """
+        Add or refresh Key. Now is the current time (e.g. the capture time of the frame's batch);
+        time.time() is used if it is not given.
+        """
+        if Now is None:
+            Now = time.time()
+        Added = self.Entries.get(Key)
+        if Added is None or Now - Added > self.RefreshAge:
+            self.Entries[Key] = Now
+            self.Entries.move_to_end(Key)
+            if len(self.Entries) > self.MaxSize:
+                self.Entries.popitem(last=False)
+        if Now != self.LastExpired:
+            self.LastExpired = Now
+            self.Expire(Now)
+
+    def Expire(self, Now):
+        """Drop entries that were last added more than TTL seconds before Now."""
+        while self.Entries:
+            Oldest = next(iter(self.Entries))
+            if Now - self.Entries[Oldest] <= self.TTL:
+                break
+            del self.Entries[Oldest]
+
+    def __contains__(self, Key):
+        Added = self.Entries.get(Key)
+        return Added is not None and time.time() - Added <= self.TTL
+
+    def __iter__(self):
+        self.Expire(time.time())
+        return iter(list(self.Entries))
+
+    def __len__(self):
+        self.Expire(time.time())
+        return len(self.Entries)
 
 # Global sets for tracking alerts and unrecognised SSIDs.
-AlertedRogues = set()      # Stores tuples (SSID, rogue BSSID) that have already been alerted.
-UnrecognisedSSIDs = set()  # Stores SSIDs that are not in either trusted dictionary.
+# Both forget entries after an hour (so a rogue AP that is still present is alerted again) and are capped in size.
+AlertedRogues = ExpiringSet()      # Stores tuples (SSID, rogue BSSID) that have already been alerted.
+UnrecognisedSSIDs = ExpiringSet()  # Stores SSIDs that are not in either trusted dictionary, refreshed each time they are seen.
 
 def NormaliseSSID(SSID):
     """
@@ -20,6 +83,15 @@ def NormaliseSSID(SSID):
     """
     return SSID.replace("’", "'").replace("\u0000", "").strip()
 
+@lru_cache(maxsize=4096)
+def DecodeSSID(SSIDRaw):
+    """
+    Decode and normalise the raw SSID bytes from a beacon.
+    Cached because the same handful of SSIDs is beaconed many times per second.
+    """
+    return NormaliseSSID(SSIDRaw.decode(errors='ignore'))
+
+@lru_cache(maxsize=4096)
 def GetPrefix(BSSID):
     """Return the first three octets (prefix) of the BSSID in lowercase."""
     parts = BSSID.split(":")
@@ -27,10 +99,27 @@ def GetPrefix(BSSID):
         return ":".join(parts[:3]).lower()
     return BSSID.lower()
 
+@lru_cache(maxsize=4096)
+def MatchPublicSSID(SSID):
+    """
+    Return the public trusted SSID that SSID belongs to, or None.
+    An exact match wins; otherwise the longest public SSID that SSID starts with is used, so aliases
+    such as "BTWifi-with-FON" are checked against a trusted "BTWifi". Only the distinct public SSID
+    lengths are probed, so each lookup is a few dictionary hits regardless of how many are trusted.
+    Cleared whenever the public list changes.
+    """
+    if SSID in PublicTrusted:
+        return SSID
+    for Length in PublicSSIDLengths:
+        if Length < len(SSID) and SSID[:Length] in PublicTrusted:
+            return SSID[:Length]
+    return None
+
 def PublishAlert(AlertData):
     """Publish AlertData (as JSON) to the MQTT 'alerts/rogue_ap' topic using the centralised helper."""
     mqtt_helper.publish("alerts/rogue_ap", AlertData)
-    print("Published MQTT alert:", json.dumps(AlertData))
+    if MQTTHelper.DEBUG:
+        print("Published MQTT alert:", json.dumps(AlertData))
 
 def UpdateTrustedCallback(Data):
     """
@@ -48,70 +137,88 @@ def UpdateTrustedCallback(Data):
       }
     For public networks, this function converts each provided BSSID to its prefix.
     """
-    global PersonalTrusted, PublicTrusted
+    global PersonalTrusted, PublicTrusted, PublicSSIDLengths, TrustedPersonalPairs
     if "personal" in Data:
-        # Store full BSSIDs (normalised to lowercase).
-        PersonalTrusted = { k: [x.lower() for x in v] for k, v in Data["personal"].items() }
+        # Store full BSSIDs (normalised to lowercase) as sets for constant-time lookups.
+        PersonalTrusted = { k: frozenset(x.lower() for x in v) for k, v in Data["personal"].items() }
+        TrustedPersonalPairs = frozenset((k, x) for k, v in PersonalTrusted.items() for x in v)
         print("Updated personal trusted networks:", PersonalTrusted)
     if "public" in Data:
         # For public networks, store only the BSSID prefix.
-        PublicTrusted = { k: [GetPrefix(x) for x in v] for k, v in Data["public"].items() }
+        PublicTrusted = { k: frozenset(GetPrefix(x) for x in v) for k, v in Data["public"].items() if k }
+        PublicSSIDLengths = tuple(sorted({len(k) for k in PublicTrusted}, reverse=True))
+        MatchPublicSSID.cache_clear()
         print("Updated public trusted networks:", PublicTrusted)
 
 # Subscribe to the update trusted command.
 mqtt_helper.subscribe("commands/update_trusted", UpdateTrustedCallback)
 
-def DetectRogue(Pkt):
-    """Process beacon frames to detect rogue APs and publish MQTT alerts."""
-    if Pkt.haslayer(Dot11Beacon):
-        try:
-            SSIDRaw = Pkt[Dot11Elt].info.decode(errors='ignore')
-            SSID = NormaliseSSID(SSIDRaw)
-        except Exception:
-            SSID = "<unknown>"
-        BSSID = Pkt[Dot11].addr2.lower()
-
-        # Check against personal trusted networks (full BSSID match).
-        if SSID in PersonalTrusted:
-            AllowedBSSIDs = PersonalTrusted[SSID]
-            if BSSID not in AllowedBSSIDs:
-                if (SSID, BSSID) not in AlertedRogues:
-                    AlertData = {
-                        "alert_type": "rogue_ap",
-                        "network_type": "personal",
-                        "ssid": SSID,
-                        "detected_bssid": BSSID,
-                        "expected": AllowedBSSIDs
-                    }
-                    PublishAlert(AlertData)
-                    AlertedRogues.add((SSID, BSSID))
-        # Check against public trusted networks (prefix match).
-        elif SSID in PublicTrusted:
-            AllowedPrefixes = PublicTrusted[SSID]
-            DetectedPrefix = GetPrefix(BSSID)
-            if DetectedPrefix not in AllowedPrefixes:
-                if (SSID, BSSID) not in AlertedRogues:
-                    AlertData = {
-                        "alert_type": "rogue_ap",
-                        "network_type": "public",
-                        "ssid": SSID,
-                        "detected_bssid": BSSID,
-                        "detected_prefix": DetectedPrefix,
-                        "expected_prefixes": AllowedPrefixes
-                    }
-                    PublishAlert(AlertData)
-                    AlertedRogues.add((SSID, BSSID))
-        else:
-            # Normalise the SSID and add to unrecognised set if it's not empty.
-            CleanSSID = NormaliseSSID(SSID)
-            if CleanSSID:
-                UnrecognisedSSIDs.add(CleanSSID)
-
-def StartSniffing(Interface="wlan1"):
+def DetectRogue(Frame, CurrentTime):
+    """
+    Process raw beacon frames to detect rogue APs and publish MQTT alerts. Only beacons reach this function.
+    CurrentTime is the capture time of the frame's batch, used to stamp (and expire) the tracked sets.
+    """
+    SSIDRaw = BeaconSSID(Frame)
+    SSID = DecodeSSID(SSIDRaw) if SSIDRaw is not None else "<unknown>"
+    BSSID = FrameAddresses(Frame)[1]  # Already lowercase, read straight from the 802.11 header.
+
+    # Fast path: a personal network seen from one of its trusted BSSIDs.
+    if (SSID, BSSID) in TrustedPersonalPairs:
+        return
+
+    PublicSSID = MatchPublicSSID(SSID)
+
+    # Check against personal trusted networks (full BSSID match).
+    if SSID in PersonalTrusted:
+        AllowedBSSIDs = PersonalTrusted[SSID]
+        if BSSID not in AllowedBSSIDs:
+            if (SSID, BSSID) not in AlertedRogues:
+                AlertData = {
+                    "alert_type": "rogue_ap",
+                    "network_type": "personal",
+                    "ssid": SSID,
+                    "detected_bssid": BSSID,
+                    "expected": sorted(AllowedBSSIDs)
+                }
+                PublishAlert(AlertData)
+                AlertedRogues.add((SSID, BSSID), CurrentTime)
+    # Check against public trusted networks (BSSID prefix match), including SSIDs that extend a public SSID.
+    elif PublicSSID is not None:
+        AllowedPrefixes = PublicTrusted[PublicSSID]
+        DetectedPrefix = GetPrefix(BSSID)
+        if DetectedPrefix not in AllowedPrefixes:
+            if (SSID, BSSID) not in AlertedRogues:
+                AlertData = {
+                    "alert_type": "rogue_ap",
+                    "network_type": "public",
+                    "ssid": SSID,
+                    "trusted_ssid": PublicSSID,
+                    "detected_bssid": BSSID,
+                    "detected_prefix": DetectedPrefix,
+                    "expected_prefixes": sorted(AllowedPrefixes)
+                }
+                PublishAlert(AlertData)
+                AlertedRogues.add((SSID, BSSID), CurrentTime)
+    else:
+        # The SSID is already normalised; add it to the unrecognised set if it's not empty.
+        if SSID:
+            UnrecognisedSSIDs.add(SSID, CurrentTime)
+
+def ApplyCommands(CommandQueue):
+    """
+    Apply commands forwarded by the parent process when running as a detector process.
+    ("update_trusted", Data) replaces the trusted network lists, as UpdateTrustedCallback does.
+    """
+    while not CommandQueue.empty():
+        Name, Data = CommandQueue.get()
+        if Name == "update_trusted":
+            UpdateTrustedCallback(Data)
+
+def StartSniffing(Interface="wlan1", OnBatch=None):
     print(f"[*] Starting rogue AP detection on interface: {Interface}")
     try:
-        # Run sniffing continuously.
-        sniff(iface=Interface, prn=DetectRogue, store=0)
+        # Capture continuously; the kernel filter passes only beacon frames.
+        CaptureFrames(Interface, BEACON_FILTER, DetectRogue, OnBatch)
     except KeyboardInterrupt:
         print("Sniffing interrupted by user, stopping...")
     except Exception as E:
@@ -123,13 +230,23 @@ def StartSniffing(Interface="wlan1"):
             "alert_type": "unrecognised_aps",
             "ssids": list(UnrecognisedSSIDs)
         }
-        PublishAlert(AlertData)
+        # Informational only, so it is sent as telemetry (QoS 0).
+        mqtt_helper.publish_telemetry("alerts/rogue_ap", AlertData)
         print(f"[UNRECOGNISED APS] The following SSIDs were detected and are not in the trusted lists: {', '.join(UnrecognisedSSIDs)}")
 
-def Main():
+def Main(AlertPipe=None, CommandQueue=None):
+    """
+    Run rogue AP detection. When started as a separate process by Main.py, alerts are sent to the
+    parent over AlertPipe and trusted network updates arrive on CommandQueue.
+    """
+    global mqtt_helper
     Interface = sys.argv[1] if len(sys.argv) > 1 else "wlan1"
+    OnBatch = None
+    if AlertPipe is not None:
+        mqtt_helper = PipePublisher(AlertPipe)
+        OnBatch = lambda Now: ApplyCommands(CommandQueue)
     # Do not call mqtt_helper.connect() or disconnect() here; these are managed centrally.
-    StartSniffing(Interface=Interface)
+    StartSniffing(Interface=Interface, OnBatch=OnBatch)
 
 if __name__ == "__main__":
     Main()
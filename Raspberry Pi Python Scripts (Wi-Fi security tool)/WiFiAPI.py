@@ -1,18 +1,148 @@
 #!/usr/bin/env python3
 from flask import Flask, request, jsonify, after_this_request
-import subprocess, re, time, threading
+import subprocess, re, time, uuid, socket, select, struct
+from concurrent.futures import ThreadPoolExecutor
 
 app = Flask(__name__)
 
 # Precompile a regex to strip ANSI escape sequences.
 AnsiEscape = re.compile(r'\x1B\[[0-?]*[ -/]*[@-~]')
 
+# Background workers for nmcli connection attempts, so request threads are never blocked on them.
+Executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="WiFiConnect")
+
+# Connection jobs by ID, as (Future, submission time) pairs. Each Future resolves to a
+# (response body, HTTP status) tuple. A job is removed once its final result has been served.
+Jobs = {}
+# Finished jobs whose result is never collected are dropped this many seconds after submission.
+JOB_RETENTION = 600
+
+def PruneJobs():
+    """Drop finished jobs that were submitted more than JOB_RETENTION seconds ago."""
+    cutoff = time.monotonic() - JOB_RETENTION
+    for job_id, (future, submitted) in list(Jobs.items()):
+        if future.done() and submitted < cutoff:
+            Jobs.pop(job_id, None)
+
+# rtnetlink constants (linux/rtnetlink.h, linux/if_addr.h) used to wait for wlan0's IPv4 address.
+RTMGRP_IPV4_IFADDR = 0x10
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+IFA_ADDRESS = 1
+NLMSG_HDR = struct.Struct("=IHHII")    # len, type, flags, seq, pid
+IFADDRMSG = struct.Struct("=BBBBI")    # family, prefixlen, flags, scope, index
+RTATTR_HDR = struct.Struct("=HH")      # len, type
+
+def OpenAddressMonitor():
+    """Open a netlink socket subscribed to kernel IPv4 address events."""
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+    sock.bind((0, RTMGRP_IPV4_IFADDR))
+    return sock
+
+def RequestAddressDump(sock):
+    """
+    Ask the kernel for every current IPv4 address. The replies arrive on sock as RTM_NEWADDR
+    messages, alongside any address events, so WaitForAddress picks up an address that was
+    assigned before the socket was opened.
+    """
+    request = IFADDRMSG.pack(socket.AF_INET, 0, 0, 0, 0)
+    header = NLMSG_HDR.pack(NLMSG_HDR.size + len(request), RTM_GETADDR,
+                            NLM_F_REQUEST | NLM_F_DUMP, 1, 0)
+    sock.send(header + request)
+
+def ParseNewAddress(data, ifindex):
+    """
+    Return "address/prefixlen" from the first RTM_NEWADDR message for ifindex in a netlink
+    datagram, or "" if there is none.
+    """
+    offset = 0
+    while offset + NLMSG_HDR.size <= len(data):
+        msg_len, msg_type, _, _, _ = NLMSG_HDR.unpack_from(data, offset)
+        if msg_len < NLMSG_HDR.size:
+            break
+        body = offset + NLMSG_HDR.size
+        if msg_type == RTM_NEWADDR:
+            family, prefixlen, _, _, index = IFADDRMSG.unpack_from(data, body)
+            if family == socket.AF_INET and index == ifindex:
+                attr = body + IFADDRMSG.size
+                while attr + RTATTR_HDR.size <= offset + msg_len:
+                    attr_len, attr_type = RTATTR_HDR.unpack_from(data, attr)
+                    if attr_len < RTATTR_HDR.size:
+                        break
+                    if attr_type == IFA_ADDRESS:
+                        address = socket.inet_ntoa(data[attr + RTATTR_HDR.size:attr + 8])
+                        return f"{address}/{prefixlen}"
+                    attr += (attr_len + 3) & ~3
+        offset += (msg_len + 3) & ~3
+    return ""
+
+def WaitForAddress(sock, ifname, timeout):
+    """
+    Block on the address monitor until ifname is given an IPv4 address or timeout seconds pass.
+    Returns "address/prefixlen", or "" on timeout.
+    """
+    ifindex = socket.if_nametoindex(ifname)
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return ""
+        readable, _, _ = select.select([sock], [], [], remaining)
+        if readable:
+            address = ParseNewAddress(sock.recv(65536), ifindex)
+            if address:
+                return address
+
+def ConnectWiFi(ssid, password):
+    """
+    Connect wlan0 to the given SSID via nmcli and wait until an IP is assigned.
+    Runs on the executor; returns a (response body, HTTP status) tuple.
+    """
+    # Subscribe to address events before connecting, so an address assigned while nmcli
+    # is still running is not missed.
+    monitor = OpenAddressMonitor()
+    try:
+        # Connect with nmcli
+        try:
+            # Output is only needed (and decoded) for the error message.
+            subprocess.run(
+                ["sudo", "nmcli", "dev", "wifi", "connect", ssid,
+                 "password", password, "ifname", "wlan0"],
+                stdin=subprocess.DEVNULL, capture_output=True, check=True
+            )
+        except subprocess.CalledProcessError as e:
+            out = AnsiEscape.sub('', (e.stdout + e.stderr).decode(errors="replace"))
+            return {
+                "status": "error",
+                "message": f"Failed to connect wlan0 to '{ssid}':\n{out}"
+            }, 500
+
+        # nmcli usually returns once DHCP has finished, so ask for the current addresses, then
+        # wait for the kernel to report wlan0's address either way (up to 30s)
+        RequestAddressDump(monitor)
+        wlan0_ip = WaitForAddress(monitor, "wlan0", 30)
+    finally:
+        monitor.close()
+
+    if not wlan0_ip:
+        return {
+            "status": "error",
+            "message": "wlan0 did not receive an IP within the timeout period."
+        }, 500
+
+    return {
+        "status": "success",
+        "message": f"Connected wlan0 to '{ssid}'.",
+        "wlan0_ip": wlan0_ip
+    }, 200
+
 @app.route('/configure_wifi', methods=['POST'])
 def ConfigureWiFi():
     """
-    Receives Wi-Fi credentials, connects wlan0 to the given SSID via nmcli,
-    polls until an IP is assigned, then returns that IP and tears down the AP
-    a few seconds after the HTTP response is sent.
+    Receives Wi-Fi credentials, saves them and starts connecting wlan0 in the background.
+    Returns 202 with a job ID straight away; the client polls /configure_wifi/<job_id> for the result.
     """
     data = request.get_json(force=True)
     ssid = data.get('ssid')
@@ -37,62 +167,60 @@ def ConfigureWiFi():
             "message": f"Failed to save configuration: {e}"
         }), 500
 
-    # Connect with nmcli
-    try:
-        result = subprocess.run(
-            ["sudo", "nmcli", "dev", "wifi", "connect", ssid,
-             "password", password, "ifname", "wlan0"],
-            capture_output=True, text=True, check=True
-        )
-        nm_out = result.stdout
-    except subprocess.CalledProcessError as e:
-        out = AnsiEscape.sub('', e.stdout + e.stderr)
-        return jsonify({
-            "status": "error",
-            "message": f"Failed to connect wlan0 to '{ssid}':\n{out}"
-        }), 500
-
-    # Poll for IP (up to 30s)
-    wlan0_ip = ""
-    timeout, interval = 30, 2
-    for _ in range(timeout // interval):
-        ip_r = subprocess.run(
-            ["nmcli", "-g", "IP4.ADDRESS", "dev", "show", "wlan0"],
-            capture_output=True, text=True
-        )
-        wlan0_ip = ip_r.stdout.strip()
-        if wlan0_ip:
-            break
-        time.sleep(interval)
+    PruneJobs()
+    job_id = uuid.uuid4().hex
+    Jobs[job_id] = (Executor.submit(ConnectWiFi, ssid, password), time.monotonic())
+    return jsonify({
+        "status": "pending",
+        "message": f"Connecting wlan0 to '{ssid}'.",
+        "job_id": job_id
+    }), 202
 
-    if not wlan0_ip:
+@app.route('/configure_wifi/<job_id>', methods=['GET'])
+def ConfigureWiFiStatus(job_id):
+    """
+    Reports the state of a connection job: 202 while nmcli is still running, then the final result.
+    The final result is served once, after which the job is forgotten; on success the AP is torn
+    down once that HTTP response has been sent.
+    """
+    job = Jobs.get(job_id)
+    if job is not None and not job[0].done():
+        return jsonify({
+            "status": "pending",
+            "message": "Still connecting wlan0."
+        }), 202
+    # Only the poll that removes the finished job serves its result, so the teardown is registered once.
+    job = Jobs.pop(job_id, None)
+    if job is None:
         return jsonify({
             "status": "error",
-            "message": "wlan0 did not receive an IP within the timeout period."
-        }), 500
+            "message": "Unknown job ID."
+        }), 404
+    future, _ = job
 
-    # Schedule AP teardown after the response goes out
-    @after_this_request
-    def schedule_teardown(response):
-        def _delayed_stop():
-            time.sleep(5)  # give client time to finish the HTTP call
-            subprocess.run(
+    try:
+        body, status = future.result()
+    except Exception as e:
+        body, status = {
+            "status": "error",
+            "message": f"Connection job failed: {e}"
+        }, 500
+    if status == 200:
+        # Tear the AP down as soon as the response has been sent to the client
+        @after_this_request
+        def schedule_teardown(response):
+            # call_on_close runs on the request's worker thread, so start systemctl without waiting for it
+            response.call_on_close(lambda: subprocess.Popen(
                 ["sudo", "systemctl", "stop", "virtual-ap.service"],
-                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-            )
-        threading.Thread(target=_delayed_stop, daemon=True).start()
-        return response
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            ))
+            return response
 
-    # Return success with the new IP
-    return jsonify({
-        "status": "success",
-        "message": f"Connected wlan0 to '{ssid}'.",
-        "wlan0_ip": wlan0_ip
-    }), 200
+    return jsonify(body), status
 
 if __name__ == "__main__":
     app.run(
-        host="0.0.0.0", port=5000,
+        host="0.0.0.0", port=5000, threaded=True,
         ssl_context=(
             '/home/ismail/wifi-security-tool/data/cert.pem',
             '/home/ismail/wifi-security-tool/data/key.pem'
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+NativeWlan.py - Reads the Wi‑Fi scan list straight from the Windows Native Wifi API (wlanapi.dll).
+
+WiFiSecurityApp uses this instead of running and parsing 'netsh wlan show networks mode=bssid'.
+The API is loaded and a client handle opened on first use; both are reused for every later scan.
+Any failure (including running on a platform without wlanapi.dll) raises OSError, so callers can
+fall back to netsh.
+"""
+
+import atexit
+import ctypes
+import threading
+from ctypes import wintypes
+
+WLAN_CLIENT_VERSION = 2   # Windows Vista and later.
+DOT11_BSS_TYPE_ANY = 3
+DOT11_SSID_MAX_LENGTH = 32
+ERROR_SUCCESS = 0
+WLAN_NOTIFICATION_SOURCE_NONE = 0
+WLAN_NOTIFICATION_SOURCE_ACM = 0x8
+WLAN_NOTIFICATION_ACM_CONNECTION_COMPLETE = 10
+WLAN_NOTIFICATION_ACM_CONNECTION_ATTEMPT_FAIL = 11
+WLAN_REASON_CODE_SUCCESS = 0
+
+# ---------------- wlanapi.h Structures ----------------
+class GUID(ctypes.Structure):
+    _fields_ = [("Data1", wintypes.DWORD),
+                ("Data2", wintypes.WORD),
+                ("Data3", wintypes.WORD),
+                ("Data4", ctypes.c_ubyte * 8)]
+
+class WLAN_INTERFACE_INFO(ctypes.Structure):
+    _fields_ = [("InterfaceGuid", GUID),
+                ("strInterfaceDescription", ctypes.c_wchar * 256),
+                ("isState", ctypes.c_int)]
+
+class WLAN_INTERFACE_INFO_LIST(ctypes.Structure):
+    _fields_ = [("dwNumberOfItems", wintypes.DWORD),
+                ("dwIndex", wintypes.DWORD),
+                ("InterfaceInfo", WLAN_INTERFACE_INFO * 1)]  # Variable length.
+
+class DOT11_SSID(ctypes.Structure):
+    _fields_ = [("uSSIDLength", wintypes.ULONG),
+                ("ucSSID", ctypes.c_ubyte * DOT11_SSID_MAX_LENGTH)]
+
+class WLAN_RATE_SET(ctypes.Structure):
+    _fields_ = [("uRateSetLength", wintypes.ULONG),
+                ("usRateSet", wintypes.USHORT * 126)]
+
+class WLAN_BSS_ENTRY(ctypes.Structure):
+    _fields_ = [("dot11Ssid", DOT11_SSID),
+                ("uPhyId", wintypes.ULONG),
+                ("dot11Bssid", ctypes.c_ubyte * 6),
+                ("dot11BssType", ctypes.c_int),
+                ("dot11BssPhyType", ctypes.c_int),
+                ("lRssi", wintypes.LONG),
+                ("uLinkQuality", wintypes.ULONG),
+                ("bInRegDomain", wintypes.BOOLEAN),
+                ("usBeaconPeriod", wintypes.USHORT),
+                ("ullTimestamp", ctypes.c_ulonglong),
+                ("ullHostTimestamp", ctypes.c_ulonglong),
+                ("usCapabilityInformation", wintypes.USHORT),
+                ("ulChCenterFrequency", wintypes.ULONG),
+                ("wlanRateSet", WLAN_RATE_SET),
+                ("ulIeOffset", wintypes.ULONG),
+                ("ulIeSize", wintypes.ULONG)]
+
+class WLAN_BSS_LIST(ctypes.Structure):
+    _fields_ = [("dwTotalSize", wintypes.DWORD),
+                ("dwNumberOfItems", wintypes.DWORD),
+                ("wlanBssEntries", WLAN_BSS_ENTRY * 1)]  # Variable length.
+
+class WLAN_NOTIFICATION_DATA(ctypes.Structure):
+    _fields_ = [("NotificationSource", wintypes.DWORD),
+                ("NotificationCode", wintypes.DWORD),
+                ("InterfaceGuid", GUID),
+                ("dwDataSize", wintypes.DWORD),
+                ("pData", ctypes.c_void_p)]
+
+class WLAN_CONNECTION_NOTIFICATION_DATA(ctypes.Structure):
+    _fields_ = [("wlanConnectionMode", ctypes.c_int),
+                ("strProfileName", ctypes.c_wchar * 256),
+                ("dot11Ssid", DOT11_SSID),
+                ("dot11BssType", ctypes.c_int),
+                ("bSecurityEnabled", wintypes.BOOL),
+                ("wlanReasonCode", wintypes.DWORD),
+                ("dwFlags", wintypes.DWORD),
+                ("strProfileXml", ctypes.c_wchar * 1)]  # Variable length.
+
+# WLAN_NOTIFICATION_CALLBACK; stdcall callbacks only exist on Windows.
+if hasattr(ctypes, "WINFUNCTYPE"):
+    WLAN_NOTIFICATION_CALLBACK = ctypes.WINFUNCTYPE(None, ctypes.POINTER(WLAN_NOTIFICATION_DATA), ctypes.c_void_p)
+else:
+    WLAN_NOTIFICATION_CALLBACK = None
+
+# wlanapi.dll and the open client handle, set by LoadApi.
+WlanApi = None
+WlanHandle = None
+# Notification callbacks currently registered with wlanapi. They are referenced from here until
+# unregistration succeeds, so wlanapi never calls a callback that has been freed.
+RegisteredCallbacks = set()
+
+def CheckResult(result, function):
+    """Raise OSError if a wlanapi call did not return ERROR_SUCCESS."""
+    if result != ERROR_SUCCESS:
+        raise OSError(result, f"{function} failed with error code {result}")
+
+def LoadApi():
+    """
+    Load wlanapi.dll and open a client handle, or return the ones opened by an earlier call.
+    Returns (api, handle).
+    """
+    global WlanApi, WlanHandle
+    if WlanHandle is not None:
+        return WlanApi, WlanHandle
+    if not hasattr(ctypes, "WinDLL"):
+        raise OSError("The Native Wifi API is only available on Windows.")
+    api = ctypes.WinDLL("wlanapi.dll")
+    api.WlanOpenHandle.argtypes = [wintypes.DWORD, ctypes.c_void_p,
+                                   ctypes.POINTER(wintypes.DWORD), ctypes.POINTER(wintypes.HANDLE)]
+    api.WlanCloseHandle.argtypes = [wintypes.HANDLE, ctypes.c_void_p]
+    api.WlanEnumInterfaces.argtypes = [wintypes.HANDLE, ctypes.c_void_p,
+                                       ctypes.POINTER(ctypes.POINTER(WLAN_INTERFACE_INFO_LIST))]
+    api.WlanGetNetworkBssList.argtypes = [wintypes.HANDLE, ctypes.POINTER(GUID), ctypes.POINTER(DOT11_SSID),
+                                          ctypes.c_int, wintypes.BOOL, ctypes.c_void_p,
+                                          ctypes.POINTER(ctypes.POINTER(WLAN_BSS_LIST))]
+    api.WlanRegisterNotification.argtypes = [wintypes.HANDLE, wintypes.DWORD, wintypes.BOOL,
+                                             WLAN_NOTIFICATION_CALLBACK, ctypes.c_void_p, ctypes.c_void_p,
+                                             ctypes.POINTER(wintypes.DWORD)]
+    api.WlanFreeMemory.argtypes = [ctypes.c_void_p]
+    api.WlanFreeMemory.restype = None
+    for function in (api.WlanOpenHandle, api.WlanCloseHandle, api.WlanEnumInterfaces, api.WlanGetNetworkBssList,
+                     api.WlanRegisterNotification):
+        function.restype = wintypes.DWORD
+
+    negotiatedVersion = wintypes.DWORD()
+    handle = wintypes.HANDLE()
+    CheckResult(api.WlanOpenHandle(WLAN_CLIENT_VERSION, None, ctypes.byref(negotiatedVersion), ctypes.byref(handle)),
+                "WlanOpenHandle")
+    WlanApi, WlanHandle = api, handle
+    return api, handle
+
+@atexit.register
+def CloseApi():
+    """Close the cached client handle, if one was opened."""
+    global WlanHandle
+    if WlanHandle is not None:
+        WlanApi.WlanCloseHandle(WlanHandle, None)
+        WlanHandle = None
+
+def GetNetworkBssList():
+    """
+    Returns the networks in the latest scan of every wireless interface as a list of dictionaries
+    with keys 'ssid' and 'bssids' (lowercase, colon-separated), one dictionary per SSID.
+    """
+    api, handle = LoadApi()
+    interfaces = ctypes.POINTER(WLAN_INTERFACE_INFO_LIST)()
+    CheckResult(api.WlanEnumInterfaces(handle, None, ctypes.byref(interfaces)), "WlanEnumInterfaces")
+    networks = {}
+    try:
+        interfaceInfo = ctypes.cast(interfaces.contents.InterfaceInfo, ctypes.POINTER(WLAN_INTERFACE_INFO))
+        for i in range(interfaces.contents.dwNumberOfItems):
+            bssList = ctypes.POINTER(WLAN_BSS_LIST)()
+            CheckResult(api.WlanGetNetworkBssList(handle, ctypes.byref(interfaceInfo[i].InterfaceGuid), None,
+                                                  DOT11_BSS_TYPE_ANY, False, None, ctypes.byref(bssList)),
+                        "WlanGetNetworkBssList")
+            try:
+                entries = ctypes.cast(bssList.contents.wlanBssEntries, ctypes.POINTER(WLAN_BSS_ENTRY))
+                for j in range(bssList.contents.dwNumberOfItems):
+                    entry = entries[j]
+                    length = min(entry.dot11Ssid.uSSIDLength, DOT11_SSID_MAX_LENGTH)
+                    ssid = bytes(entry.dot11Ssid.ucSSID[:length]).decode("utf-8", "ignore")
+                    bssid = ":".join(f"{b:02x}" for b in entry.dot11Bssid)
+                    bssids = networks.setdefault(ssid, [])
+                    if bssid not in bssids:
+                        bssids.append(bssid)
+            finally:
+                api.WlanFreeMemory(bssList)
+    finally:
+        api.WlanFreeMemory(interfaces)
+    return [{"ssid": ssid, "bssids": bssids} for ssid, bssids in networks.items()]
+
+class ConnectionWatcher:
+    """
+    Waits for Windows to finish connecting to an SSID, using the Native Wifi "connection complete"
+    notification instead of sleeping for a fixed time.
+    Create it before starting the connection (e.g. with 'netsh wlan connect') so the notification
+    cannot be missed, call wait(), then close(). The constructor raises OSError if notifications
+    cannot be registered. Only one watcher can be registered at a time.
+    """
+    def __init__(self, ssid):
+        self.ssid = ssid.encode("utf-8")
+        self.done = threading.Event()
+        self.connected = False
+        self.api, self.handle = LoadApi()
+        # Keep a reference to the callback for as long as it is registered.
+        self.callback = WLAN_NOTIFICATION_CALLBACK(self.on_notification)
+        CheckResult(self.api.WlanRegisterNotification(self.handle, WLAN_NOTIFICATION_SOURCE_ACM, True,
+                                                      self.callback, None, None, None),
+                    "WlanRegisterNotification")
+        RegisteredCallbacks.add(self.callback)
+
+    def on_notification(self, data, context):
+        """Called by wlanapi on its own thread for every ACM notification."""
+        code = data.contents.NotificationCode
+        if code not in (WLAN_NOTIFICATION_ACM_CONNECTION_COMPLETE, WLAN_NOTIFICATION_ACM_CONNECTION_ATTEMPT_FAIL):
+            return
+        info = ctypes.cast(data.contents.pData, ctypes.POINTER(WLAN_CONNECTION_NOTIFICATION_DATA)).contents
+        length = min(info.dot11Ssid.uSSIDLength, DOT11_SSID_MAX_LENGTH)
+        if bytes(info.dot11Ssid.ucSSID[:length]) != self.ssid:
+            return
+        self.connected = (code == WLAN_NOTIFICATION_ACM_CONNECTION_COMPLETE
+                          and info.wlanReasonCode == WLAN_REASON_CODE_SUCCESS)
+        self.done.set()
+
+    def wait(self, timeout):
+        """
+        Blocks until the connection completes or fails, or timeout seconds pass.
+        Returns True only if Windows reported a successful connection.
+        """
+        self.done.wait(timeout)
+        return self.connected
+
+    def close(self):
+        """Stops receiving notifications. Raises OSError if they could not be unregistered."""
+        if self.callback not in RegisteredCallbacks:
+            return
+        # A NULL callback; ctypes does not accept None for a function pointer argument.
+        CheckResult(self.api.WlanRegisterNotification(self.handle, WLAN_NOTIFICATION_SOURCE_NONE, True,
+                                                      WLAN_NOTIFICATION_CALLBACK(), None, None, None),
+                    "WlanRegisterNotification")
+        RegisteredCallbacks.discard(self.callback)
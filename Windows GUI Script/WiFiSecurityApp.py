@@ -3,7 +3,7 @@
 WiFiSecurityApp.py - A KivyMD app for interacting with the Pi's Wi‑Fi Security Assessment Tool.
 
 Workflow:
-  1. The app starts on the Wi‑Fi Configuration screen where it scans for available Wi‑Fi networks (using netsh on Windows).
+  1. The app starts on the Wi‑Fi Configuration screen where it scans for available Wi‑Fi networks (using the Windows Native Wifi API, or netsh as a fallback).
      The user selects a network and enters its password; these credentials are sent via a REST API to the Pi.
   2. On successful configuration, the app transitions to the Main screen.
   3. The Main screen auto‑refreshes to display notifications as clickable bars (using an MDList). Each notification shows a brief
@@ -19,7 +19,8 @@ Usage:
   python WiFiSecurityApp.py
 """
 
-import json, threading, subprocess, requests, time, re
+import json, threading, subprocess, requests, time, re, queue, math, os, ssl, hashlib
+from requests.adapters import HTTPAdapter
 from kivy.lang import Builder
 from kivy.clock import Clock
 from kivy.properties import StringProperty, ListProperty
@@ -32,84 +33,176 @@ from kivymd.uix.label import MDLabel
 from kivymd.uix.button import MDRaisedButton
 from kivymd.uix.selectioncontrol import MDCheckbox
 from kivymd.uix.list import OneLineListItem, MDList
+from NativeWlan import GetNetworkBssList, ConnectionWatcher
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the standard library decoder.
+    orjson = None
 
 # ---------------- Configuration Constants ----------------
 MQTT_BROKER = "192.168.4.1" # Default broker IP; will be updated after Wi‑Fi configuration.
 MQTT_PORT = 1883
 REST_API_URL = "https://192.168.4.1:5000/configure_wifi"  # Replace with the Pi's IP address in the REST API URL (HTTPS)
-
-MQTT_ALERT_TOPIC = "alerts/#"
+# The Pi's self-signed HTTPS certificate; the REST API connection is pinned to it (see CreateRestSession).
+CERT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "PEM key files (used for HTTPS)", "cert.pem")
+
+MQTT_TOPIC_PROTOCOL = "alerts/protocol_assessment"
+MQTT_TOPIC_ROGUE = "alerts/rogue_ap"
+MQTT_TOPIC_DEAUTH = "alerts/deauth"
+MQTT_TOPIC_PASSWORD = "alerts/password_assessment"
+MQTT_ALERT_QOS = 1
 MQTT_CMD_RUN_ASSESSMENT = "commands/run_assessment"
 MQTT_CMD_UPDATE_TRUSTED = "commands/update_trusted"
 MQTT_CMD_BLOCK = "commands/block"
 
+# Maximum number of notifications kept in the Main screen's list; the oldest are removed first.
+MAX_VISIBLE_NOTIFICATIONS = 200
+
+# Seconds a Wi‑Fi scan result is reused before another scan is run (see RequestNetworks).
+SCAN_CACHE_TTL = 5
+
+# Matches the "Detected BSSID:" line of a rogue AP alert's details (see ExtractBssid).
+BSSID_PATTERN = re.compile(r"Detected BSSID:\s*([0-9A-Fa-f:]{17})", re.IGNORECASE)
+
+# ---------------- Alert Formatters ----------------
+def DecodeJSON(payload):
+    """Parses JSON from bytes, using orjson when it is installed. Raises ValueError on invalid input."""
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+# Each formatter takes an alert's topic and decoded payload and returns its (summary, details) strings.
+def FormatProtocolAssessment(topic, data):
+    lines = ["Protocol Assessment Summary:"]
+    lines.extend(f" • {ssid}: {classification}" for ssid, classification in data.items())
+    return "Protocol assessment completed!", "\n".join(lines) + "\n"
+
+def FormatRogueAP(topic, data):
+    details = (
+        f"Rogue AP Alert:\n"
+        f" • Network: {data.get('ssid', 'Unknown')}\n"
+        f" • Detected BSSID: {data.get('detected_bssid', 'N/A')}\n"
+        f" • Expected: {', '.join(data.get('expected', []))}\n"
+    )
+    return "Warning: Rogue AP detected!", details
+
+def FormatDeauth(topic, data):
+    details = (
+        f"De-auth Attack Alert:\n"
+        f" • Destination: {data.get('destination', 'Unknown')}\n"
+        f" • Frame Count: {data.get('frame_count', 'N/A')}\n"
+        f" • Attacker: {data.get('most_frequent_attacker', 'Unknown')}\n"
+        f" • Time Window: {data.get('time_window', 'N/A')}s\n"
+        f" • Timestamp: {data.get('timestamp', 'N/A')}\n"
+    )
+    return "De-auth attack detected!", details
+
+def FormatPasswordAssessment(topic, data):
+    lines = [
+        f"Password Assessment for {data.get('ssid', 'Unknown')}:",
+        f" • Strength: {data.get('strength', 'Unknown')}",
+    ]
+    recs = data.get("recommendations", [])
+    if recs:
+        lines.append(" • Recommendations:")
+        lines.extend(f"    - {rec}" for rec in recs)
+    lines.append(f" • Timestamp: {data.get('timestamp', 'N/A')}")
+    return "Password assessment completed!", "\n".join(lines) + "\n"
+
+def FormatOther(topic, data):
+    return "New alert received.", f"{topic}: {data}"
+
+# Formatter for each alert topic. The Pi also publishes batches of alerts on "<topic>/batch".
+ALERT_FORMATTERS = {
+    MQTT_TOPIC_PROTOCOL: FormatProtocolAssessment,
+    MQTT_TOPIC_ROGUE: FormatRogueAP,
+    MQTT_TOPIC_DEAUTH: FormatDeauth,
+    MQTT_TOPIC_PASSWORD: FormatPasswordAssessment,
+}
+
 # ---------------- MQTT Client Class ----------------
 class MQTTClient:
     """
-    MQTTClient manages the MQTT connection. It subscribes to the alert topic and stores notifications.
-    Each notification is stored as a dictionary with "summary" and "details" keys.
+    MQTTClient manages the MQTT connection. It subscribes to the alert topics and stores notifications.
+    Each notification is stored as a dictionary with "summary" and "details" keys, in a thread-safe queue
+    that the paho network thread fills and the UI thread drains.
     """
     def __init__(self):
         self.client = mqtt.Client()
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
-        self.notifications = []
+        # paho dispatches each alert topic (and its batch topic) straight to a callback with its formatter.
+        for topic, formatter in ALERT_FORMATTERS.items():
+            callback = lambda client, userdata, msg, formatter=formatter: self.handle_message(msg, formatter)
+            self.client.message_callback_add(topic, callback)
+            self.client.message_callback_add(topic + "/batch", callback)
+        # Retry quickly while the network is changing, e.g. just after switching Wi‑Fi.
+        self.client.reconnect_delay_set(min_delay=1, max_delay=8)
+        self.notifications = queue.SimpleQueue()
+        # Set once a rogue AP alert has arrived; on_rogue_ap (if set) is then called from the paho thread.
+        self.rogue_ap_detected = threading.Event()
+        self.on_rogue_ap = None
 
     def on_connect(self, client, userdata, flags, rc):
         print("Connected to MQTT broker with result code:", rc)
-        self.client.subscribe(MQTT_ALERT_TOPIC)
-        print("Subscribed to topic:", MQTT_ALERT_TOPIC)
+        topics = [(t, MQTT_ALERT_QOS) for topic in ALERT_FORMATTERS for t in (topic, topic + "/batch")]
+        self.client.subscribe(topics)
+        print("Subscribed to topics:", ", ".join(t for t, _ in topics))
 
     def on_message(self, client, userdata, msg):
+        # Only messages on topics without their own callback arrive here.
+        self.handle_message(msg, FormatOther)
+
+    def handle_message(self, msg, formatter):
+        # Alerts batched by the Pi arrive as a JSON array on "<alert topic>/batch".
+        if msg.topic.endswith("/batch"):
+            try:
+                batch = DecodeJSON(msg.payload)
+            except Exception:
+                batch = None
+            if isinstance(batch, list):
+                topic = msg.topic[:-len("/batch")]
+                for data in batch:
+                    self.add_alert(topic, data, formatter)
+                return
         try:
-            data = json.loads(msg.payload.decode())
-            if msg.topic.startswith("alerts/protocol_assessment"):
-                details = "Protocol Assessment Summary:\n"
-                for ssid, classification in data.items():
-                    details += f" • {ssid}: {classification}\n"
-                summary = "Protocol assessment completed!"
-            elif msg.topic.startswith("alerts/rogue_ap"):
-                details = (
-                    f"Rogue AP Alert:\n"
-                    f" • Network: {data.get('ssid', 'Unknown')}\n"
-                    f" • Detected BSSID: {data.get('detected_bssid', 'N/A')}\n"
-                    f" • Expected: {', '.join(data.get('expected', []))}\n"
-                )
-                summary = "Warning: Rogue AP detected!"
-            elif msg.topic.startswith("alerts/deauth"):
-                details = (
-                    f"De-auth Attack Alert:\n"
-                    f" • Destination: {data.get('destination', 'Unknown')}\n"
-                    f" • Frame Count: {data.get('frame_count', 'N/A')}\n"
-                    f" • Attacker: {data.get('most_frequent_attacker', 'Unknown')}\n"
-                    f" • Time Window: {data.get('time_window', 'N/A')}s\n"
-                    f" • Timestamp: {data.get('timestamp', 'N/A')}\n"
-                )
-                summary = "De-auth attack detected!"
-            elif msg.topic.startswith("alerts/password_assessment"):
-                details = (
-                    f"Password Assessment for {data.get('ssid', 'Unknown')}:\n"
-                    f" • Strength: {data.get('strength', 'Unknown')}\n"
-                )
-                recs = data.get("recommendations", [])
-                if recs:
-                    details += " • Recommendations:\n"
-                    for rec in recs:
-                        details += f"    - {rec}\n"
-                details += f" • Timestamp: {data.get('timestamp', 'N/A')}\n"
-                summary = "Password assessment completed!"
-            else:
-                details = f"{msg.topic}: {data}"
-                summary = "New alert received."
+            data = DecodeJSON(msg.payload)
+        except Exception:
+            data = msg.payload.decode(errors="replace")
+        self.add_alert(msg.topic, data, formatter)
+
+    def add_alert(self, topic, data, formatter=FormatOther):
+        """Format a decoded alert from the given topic with formatter and store it as a notification."""
+        try:
+            summary, details = formatter(topic, data)
         except Exception:
-            details = f"{msg.topic}: {msg.payload.decode()}"
-            summary = "New alert received."
+            summary, details = FormatOther(topic, data)
         print("MQTT Alert Received:", details)
-        shortSummary = summary if len(summary) <= 60 else summary[:60] + "..."
-        self.notifications.append({"summary": shortSummary, "details": details})
+        if formatter is FormatRogueAP and isinstance(data, dict) and data.get("alert_type") == "rogue_ap":
+            self.rogue_ap_detected.set()
+            if self.on_rogue_ap is not None:
+                self.on_rogue_ap()
+        # Summaries are short fixed strings from the formatters, so they are stored as they are.
+        self.notifications.put({"summary": summary, "details": details})
 
     def start(self):
-        self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        """
+        Starts paho's network loop thread, which connects to the broker in the background (and keeps
+        retrying until it answers), so this returns straight away.
+        """
+        self.client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
+        self.client.loop_start()
+
+    def reconnect(self, host):
+        """
+        Moves the connection to a new broker address.
+        paho's network loop returns once the client disconnects, so the finished loop thread is joined
+        and a single new one started; it keeps retrying (see reconnect_delay_set) until the broker answers.
+        """
+        self.client.disconnect()
+        self.client.loop_stop()
+        self.client.connect_async(host, MQTT_PORT, 60)
         self.client.loop_start()
 
     def publish(self, topic, payload):
@@ -125,10 +218,61 @@ def ExtractBssid(details):
     Expects a line containing "Detected BSSID:" followed by a MAC address.
     Returns the MAC address if found; otherwise, returns None.
     """
-    match = re.search(r"Detected BSSID:\s*([0-9A-Fa-f:]{17})", details, re.IGNORECASE)
-    if match:
-        return match.group(1)
-    return None
+    match = BSSID_PATTERN.search(details)
+    return match.group(1) if match else None
+
+# ---------------- REST API Session ----------------
+class PinnedCertAdapter(HTTPAdapter):
+    """
+    Transport adapter that only accepts a server certificate with the given SHA-256 fingerprint.
+    The Pi's certificate is self-signed and not issued for its IP address, so CA and hostname checks
+    cannot pass; pinning its fingerprint still rejects any other server.
+    """
+    def __init__(self, fingerprint, **kwargs):
+        self.fingerprint = fingerprint
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["assert_fingerprint"] = self.fingerprint
+        super().init_poolmanager(*args, **kwargs)
+
+def CreateRestSession():
+    """
+    Creates the persistent session used for every REST API call, so TLS connections are reused.
+    Connections are pinned to the certificate at CERT_PATH; if it cannot be read they are left
+    unverified, as they were before pinning.
+    """
+    session = requests.Session()
+    # CA and hostname verification are replaced by the fingerprint check.
+    session.verify = False
+    try:
+        with open(CERT_PATH) as f:
+            fingerprint = hashlib.sha256(ssl.PEM_cert_to_DER_cert(f.read())).hexdigest()
+        adapter = PinnedCertAdapter(fingerprint, pool_connections=2, pool_maxsize=2)
+    except (OSError, ValueError) as e:
+        print("Could not load the Pi's certificate; HTTPS connections will not be pinned:", e)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=2)
+    session.mount("https://", adapter)
+    return session
+
+# Create a global REST API session.
+restSession = CreateRestSession()
+
+# ---------------- Helper Function: WaitForConfigureJob ----------------
+def WaitForConfigureJob(jobId, timeout=90, interval=1):
+    """
+    Polls the Pi's Wi‑Fi configuration job until it finishes.
+    The Pi answers the initial POST with 202 and a job ID, then connects in the background.
+    Returns the final JSON response, or an error dictionary if the job does not finish in time.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = restSession.get(f"{REST_API_URL}/{jobId}", timeout=10)
+        data = response.json()
+        if response.status_code != 202:
+            return data
+        time.sleep(interval)
+    return {"status": "error", "message": "Timed out waiting for the Pi to connect."}
 
 # ---------------- Trusted Network Entry Widget ----------------
 class TrustedNetworkEntry(MDBoxLayout):
@@ -158,42 +302,114 @@ class TrustedNetworkEntry(MDBoxLayout):
 # ---------------- Wi‑Fi Scanner Helper (Windows) ----------------
 def GetAvailableNetworks():
     """
-    Uses 'netsh wlan show networks mode=bssid' on Windows to list available Wi‑Fi networks.
+    Lists available Wi‑Fi networks through the Windows Native Wifi API (see NativeWlan).
+    Falls back to parsing 'netsh wlan show networks mode=bssid' if the API cannot be used.
     Returns a list of dictionaries with keys 'ssid' and 'bssids'.
     """
     try:
-        output = subprocess.check_output(
+        return GetNetworkBssList()
+    except OSError as e:
+        print("Native Wifi API unavailable, falling back to netsh:", e)
+    networks = []
+    currentSsid = None
+    currentBssids = []
+    try:
+        # Parse the output line by line while netsh is still writing it.
+        with subprocess.Popen(
             ["netsh", "wlan", "show", "networks", "mode=bssid"],
-            universal_newlines=True,
-            timeout=30
-        )
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True
+        ) as proc:
+            # Cap the whole scan at 30 seconds: reading stdout blocks until netsh closes it, so kill a hung
+            # netsh rather than waiting on it.
+            killer = threading.Timer(30, proc.kill)
+            killer.daemon = True
+            killer.start()
+            try:
+                for line in proc.stdout:
+                    line = line.strip()
+                    if line.startswith("SSID "):
+                        if currentSsid is not None:
+                            networks.append({"ssid": currentSsid, "bssids": currentBssids})
+                            currentBssids = []
+                        parts = line.split(" : ", 1)
+                        if len(parts) == 2:
+                            currentSsid = parts[1].strip()
+                        else:
+                            currentSsid = "Unknown"
+                    elif line.startswith("BSSID "):
+                        parts = line.split(" : ", 1)
+                        if len(parts) == 2:
+                            bssid = parts[1].strip()
+                            currentBssids.append(bssid)
+                if proc.wait() != 0:
+                    raise subprocess.CalledProcessError(proc.returncode, proc.args)
+            except Exception:
+                proc.kill()
+                raise
+            finally:
+                killer.cancel()
     except Exception as e:
         print("Error scanning networks:", e)
         return []
-    
-    networks = []
-    currentSsid = None
-    currentBssids = []
-    for line in output.splitlines():
-        line = line.strip()
-        if line.startswith("SSID "):
-            if currentSsid is not None:
-                networks.append({"ssid": currentSsid, "bssids": currentBssids})
-                currentBssids = []
-            parts = line.split(" : ", 1)
-            if len(parts) == 2:
-                currentSsid = parts[1].strip()
-            else:
-                currentSsid = "Unknown"
-        elif line.startswith("BSSID "):
-            parts = line.split(" : ", 1)
-            if len(parts) == 2:
-                bssid = parts[1].strip()
-                currentBssids.append(bssid)
     if currentSsid is not None:
         networks.append({"ssid": currentSsid, "bssids": currentBssids})
     return networks
 
+def AggregateNetworks(nets):
+    """
+    Merges a scan result from GetAvailableNetworks into a dictionary mapping each SSID to a sorted
+    list of its distinct BSSIDs (an SSID can be listed more than once, e.g. by netsh).
+    """
+    ssidDict = {}
+    for net in nets:
+        ssidDict.setdefault(net["ssid"], set()).update(net["bssids"])
+    return {ssid: sorted(bssids) for ssid, bssids in ssidDict.items()}
+
+# ---------------- Helper Functions: Shared Wi‑Fi Scan ----------------
+# The latest aggregated scan and when it finished, plus the callbacks waiting for a scan in progress.
+scanCache = {"time": None, "networks": {}}
+scanCallbacks = []
+scanLock = threading.Lock()
+
+def RequestNetworks(callback, ttl=SCAN_CACHE_TTL):
+    """
+    Passes the aggregated available networks (see AggregateNetworks) to callback on the Kivy thread.
+    A scan finished less than ttl seconds ago is reused straight away; otherwise a scan is started on a
+    background thread, so the calling screen is never blocked, and requests made while it runs share it.
+    Must be called from the Kivy thread.
+    """
+    with scanLock:
+        fresh = scanCache["time"] is not None and time.monotonic() - scanCache["time"] < ttl
+        networks = scanCache["networks"]
+        if not fresh:
+            scanCallbacks.append(callback)
+            if len(scanCallbacks) > 1:
+                return  # A scan is already running.
+    if fresh:
+        callback(networks)
+    else:
+        threading.Thread(target=ScanNetworks, name="WiFiScan", daemon=True).start()
+
+def ScanNetworks():
+    """
+    Runs a scan, caches the result and hands it to every waiting RequestNetworks callback.
+    If the scan fails, the waiting callbacks get an empty result, so later requests can start a new scan.
+    """
+    networks = {}
+    try:
+        networks = AggregateNetworks(GetAvailableNetworks())
+    except Exception as e:
+        print("Error scanning networks:", e)
+    finally:
+        with scanLock:
+            scanCache["time"] = time.monotonic()
+            scanCache["networks"] = networks
+            callbacks = scanCallbacks[:]
+            scanCallbacks.clear()
+    for callback in callbacks:
+        Clock.schedule_once(lambda dt, callback=callback: callback(networks))
+
 # ---------------- KV Layout ----------------
 kv = '''
 ScreenManager:
@@ -245,6 +461,12 @@ ScreenManager:
             font_style: "H5"
             size_hint_y: None
             height: "48dp"
+        MDLabel:
+            text: root.connection_status
+            halign: "center"
+            font_style: "Subtitle1"
+            size_hint_y: None
+            height: "32dp" if root.connection_status else 0
         MDLabel:
             id: assessment_progress
             text: ""
@@ -349,17 +571,13 @@ class WiFiConfigScreen(Screen):
     """Screen to configure Wi‑Fi: scans available networks and sends credentials to the Pi via REST API."""
     available_networks = ListProperty([])
     status_message = StringProperty("")
+    configure_thread = None
 
     def on_enter(self):
-        nets = GetAvailableNetworks()
-        ssidDict = {}
-        for net in nets:
-            ssid = net["ssid"]
-            bssids = net["bssids"]
-            if ssid in ssidDict:
-                ssidDict[ssid] = list(set(ssidDict[ssid] + bssids))
-            else:
-                ssidDict[ssid] = bssids
+        self.status_message = "Scanning for networks..."
+        RequestNetworks(self.show_networks)
+
+    def show_networks(self, ssidDict):
         self.networks_info = ssidDict
         self.available_networks = list(ssidDict.keys())
         self.status_message = "Networks updated."
@@ -370,76 +588,162 @@ class WiFiConfigScreen(Screen):
         if network == "Select Network" or not password:
             self.status_message = "Please select a network and enter a password."
             return
+        if self.configure_thread is not None and self.configure_thread.is_alive():
+            return  # A configuration attempt is already in progress.
+        self.status_message = f"Sending credentials for '{network}' to the Pi..."
+        # The REST calls and the network switch take many seconds, so they run off the UI thread.
+        self.configure_thread = threading.Thread(target=self.configure_worker, args=(network, password),
+                                                 name="ConfigureWiFi", daemon=True)
+        self.configure_thread.start()
+
+    def set_status(self, message):
+        """Updates the status message from the configuration worker thread."""
+        Clock.schedule_once(lambda dt: setattr(self, "status_message", message))
+
+    def configure_worker(self, network, password):
         payload = {"ssid": network, "password": password}
         try:
-            response = requests.post(REST_API_URL, json=payload, verify=False, timeout=90)
+            response = restSession.post(REST_API_URL, json=payload, timeout=90)
             data = response.json()
-            self.status_message = "Success: " + data.get("message", "Wi‑Fi configured.")
-            
-            # Extract the new IP address from the response
-            if data.get("wlan0_ip"):
-                # Remove the subnet mask if present (e.g., "192.168.1.100/24")
-                new_ip = data["wlan0_ip"].split("/")[0]
-                print("Received new wlan0 IP:", new_ip)
-                
-                # Update the MQTT broker address in memory (but don't reconnect yet)
-                global MQTT_BROKER
-                MQTT_BROKER = new_ip
-                
-                # Wait 5 seconds before switching networks (stability period)
-                print("Waiting 5 seconds before switching networks...")
-                time.sleep(5)
-                
-                try:
-                    # Switch Windows to the target Wi-Fi network
-                    print(f"Connecting Windows to network: {network}")
-                    subprocess.run(
-                        ["netsh", "wlan", "connect", f"name={network}", f"ssid={network}"],
-                        check=True
-                    )
-                    
+            # The Pi connects in the background; wait for the job to report the new IP.
+            if response.status_code == 202 and data.get("job_id"):
+                data = WaitForConfigureJob(data["job_id"])
+        except Exception as e:
+            self.set_status(f"Error: {str(e)}")
+            return
+        if data.get("status") != "success":
+            self.set_status("Error: " + data.get("message", "Wi‑Fi configuration failed."))
+            return
+        self.set_status("Success: " + data.get("message", "Wi‑Fi configured."))
+
+        # Extract the new IP address from the response, removing the subnet mask if present (e.g., "192.168.1.100/24")
+        new_ip = data.get("wlan0_ip", "").split("/")[0]
+        if new_ip:
+            print("Received new wlan0 IP:", new_ip)
+        if not new_ip or (new_ip == MQTT_BROKER and mqttClient.client.is_connected()):
+            # Windows is already on the network serving this broker (e.g. the same SSID was configured again).
+            if new_ip:
+                print("Broker unchanged; skipping reconnect")
+            self.show_main("")
+            return
+
+        # Show the main screen straight away; the switch below reports its progress in the banner there.
+        self.show_main(f"Connecting Windows to '{network}'...")
+        self.switch_and_reconnect(network, new_ip)
+
+    def show_main(self, banner):
+        """Switches to the main screen with the given connection banner, from the configuration worker thread."""
+        def switch(dt):
+            self.manager.get_screen("main").connection_status = banner
+            self.manager.current = "main"
+        Clock.schedule_once(switch)
+
+    def set_banner(self, message):
+        """Updates the main screen's connection banner from the configuration worker thread."""
+        Clock.schedule_once(lambda dt: setattr(self.manager.get_screen("main"), "connection_status", message))
+
+    def switch_and_reconnect(self, network, new_ip):
+        """
+        Moves Windows to the network the Pi has just joined, then reconnects MQTT to the Pi's new address.
+        Runs on the configuration worker thread; errors are reported in the main screen's banner.
+        """
+        # Update the MQTT broker address in memory (but don't reconnect yet)
+        global MQTT_BROKER
+        MQTT_BROKER = new_ip
+
+        # Wait 5 seconds before switching networks (stability period)
+        print("Waiting 5 seconds before switching networks...")
+        time.sleep(5)
+
+        try:
+            # Watch for Windows' connection-complete notification before starting the switch.
+            try:
+                watcher = ConnectionWatcher(network)
+            except OSError as e:
+                print("Connection notifications unavailable, falling back to a fixed wait:", e)
+                watcher = None
+
+            # Switch Windows to the target Wi-Fi network
+            print(f"Connecting Windows to network: {network}")
+            try:
+                subprocess.run(
+                    ["netsh", "wlan", "connect", f"name={network}", f"ssid={network}"],
+                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                    check=True
+                )
+
+                if watcher is not None:
+                    # Wait (up to 30 seconds) for Windows to report the association
+                    print("Waiting for the network connection to complete...")
+                    if not watcher.wait(30):
+                        print(f"Windows did not report a connection to {network}; reconnecting MQTT anyway.")
+                else:
                     # Wait 10 seconds for network association and IP assignment
                     print("Waiting 10 seconds for network connection...")
                     time.sleep(10)
-                    
-                    # Now reconnect MQTT to the new broker address
-                    print("Reconnecting MQTT to new broker...")
-                    mqttClient.client.disconnect()
-                    time.sleep(1)  # Brief pause for clean disconnect
-                    mqttClient.client.connect(MQTT_BROKER, MQTT_PORT, 60)
-                    mqttClient.client.loop_start()
-                    print("MQTT broker updated to", MQTT_BROKER)
-                    
-                except Exception as e:
-                    print(f"Error during network transition: {e}")
-                    self.status_message = f"Network switch error: {str(e)}"
-                    return
-                
-            self.manager.current = "main"
+            finally:
+                if watcher is not None:
+                    try:
+                        watcher.close()
+                    except OSError as e:
+                        print("Failed to unregister connection notifications:", e)
+
+            # Now reconnect MQTT to the new broker address
+            print("Reconnecting MQTT to new broker...")
+            self.set_banner(f"Connecting to the Pi at {MQTT_BROKER}...")
+            mqttClient.reconnect(MQTT_BROKER)
+            print("MQTT broker updated to", MQTT_BROKER)
+            self.set_banner(f"Connected Windows to '{network}'.")
         except Exception as e:
-            self.status_message = f"Error: {str(e)}"
+            print(f"Error during network transition: {e}")
+            self.set_banner(f"Network switch error: {str(e)}")
 
 class MainScreen(Screen):
     """Main screen that displays notifications and offers controls for assessments and updating trusted networks."""
     alerts_text = StringProperty("")
+    # Progress of the Wi‑Fi switch started from the configuration screen.
+    connection_status = StringProperty("")
+    refresh_event = None
+    countdown_event = None
 
     def on_enter(self):
-        # Auto-refresh notifications every 2 seconds.
-        Clock.schedule_interval(self.refresh_notifications, 2)
-        # Also check for rogue AP alerts to enable the block button.
-        Clock.schedule_interval(self.check_rogue_ap, 2)
+        # Auto-refresh notifications every 2 seconds (scheduled once, however often the screen is entered).
+        if self.refresh_event is None:
+            self.refresh_event = Clock.schedule_interval(self.refresh_notifications, 2)
+            # Enable the block button when a rogue AP alert arrives, instead of polling for one.
+            # Kivy triggers may be called from any thread; the update itself runs on the UI thread.
+            mqttClient.on_rogue_ap = Clock.create_trigger(self.update_block_button)
+        self.update_block_button(0)
 
     def refresh_notifications(self, dt):
+        # Drain everything queued so far; messages arriving meanwhile are picked up on the next refresh.
+        notes = []
+        while True:
+            try:
+                notes.append(mqttClient.notifications.get_nowait())
+            except queue.Empty:
+                break
+        if not notes:
+            return
         notificationList = self.ids.notification_list
-        if mqttClient.notifications:
-            for note in mqttClient.notifications:
-                # Create a clickable list item for each notification.
-                item = OneLineListItem(
-                    text=note["summary"],
-                    on_release=lambda inst, details=note["details"]: self.open_notification_detail(details)
-                )
-                notificationList.add_widget(item)
-            mqttClient.notifications = []
+        # Only the newest notifications are shown, so a burst never builds more widgets than the list keeps.
+        notes = notes[-MAX_VISIBLE_NOTIFICATIONS:]
+        # Create a clickable list item for each notification.
+        items = [
+            OneLineListItem(
+                text=note["summary"],
+                on_release=lambda inst, details=note["details"]: self.open_notification_detail(details)
+            )
+            for note in notes
+        ]
+        # Remove the oldest items (at the end of children) to make room, then add the new ones in one pass;
+        # the list lays itself out once on the next frame rather than once per notification.
+        excess = len(notificationList.children) + len(items) - MAX_VISIBLE_NOTIFICATIONS
+        if excess > 0:
+            for oldItem in notificationList.children[-excess:]:
+                notificationList.remove_widget(oldItem)
+        for item in items:
+            notificationList.add_widget(item)
 
     def open_notification_detail(self, details):
         notifScreen = self.manager.get_screen("notification_detail")
@@ -461,9 +765,9 @@ class MainScreen(Screen):
             notifScreen.ids.detail_block_button.disabled = True
         self.manager.current = "notification_detail"
 
-    def check_rogue_ap(self, dt):
-        # Check displayed notifications for any mention of a Rogue AP.
-        if "Rogue AP" in self.alerts_text:
+    def update_block_button(self, dt):
+        # Show the block button once a rogue AP alert has been received.
+        if mqttClient.rogue_ap_detected.is_set():
             self.ids.block_button.opacity = 1
             self.ids.block_button.disabled = False
         else:
@@ -478,16 +782,20 @@ class MainScreen(Screen):
         print(f"Triggered {assessmentType} assessment.")
 
     def start_protocol_countdown(self, seconds):
-        self.ids.assessment_progress.text = f"Protocol assessment in progress: {seconds//60:02d}:{seconds%60:02d} remaining"
+        # The remaining time is worked out from a fixed end time, so late or skipped ticks do not make it drift.
+        end = time.monotonic() + seconds
         def update(dt):
-            nonlocal seconds
-            seconds -= 1
-            if seconds >= 0:
-                self.ids.assessment_progress.text = f"Protocol assessment in progress: {seconds//60:02d}:{seconds%60:02d} remaining"
-            else:
+            remaining = math.ceil(end - time.monotonic())
+            if remaining <= 0:
                 self.ids.assessment_progress.text = ""
+                self.countdown_event = None
                 return False
-        Clock.schedule_interval(update, 1)
+            self.ids.assessment_progress.text = f"Protocol assessment in progress: {remaining//60:02d}:{remaining%60:02d} remaining"
+        # Restarting the assessment restarts the countdown rather than running two at once.
+        if self.countdown_event is not None:
+            self.countdown_event.cancel()
+        update(0)
+        self.countdown_event = Clock.schedule_interval(update, 1)
 
     def block_rogue_ap(self):
         # Extract the detected BSSID from the current notification detail using the helper function.
@@ -505,15 +813,9 @@ class MainScreen(Screen):
 class UpdateTrustedScreen(Screen):
     """Screen to update trusted networks; displays available networks and allows selection of network type."""
     def on_enter(self):
-        nets = GetAvailableNetworks()
-        ssidDict = {}
-        for net in nets:
-            ssid = net["ssid"]
-            bssids = net["bssids"]
-            if ssid in ssidDict:
-                ssidDict[ssid] = list(set(ssidDict[ssid] + bssids))
-            else:
-                ssidDict[ssid] = bssids
+        RequestNetworks(self.show_networks)
+
+    def show_networks(self, ssidDict):
         grid = self.ids.networks_grid
         grid.clear_widgets()
         for ssid, bssids in ssidDict.items():
@@ -564,9 +866,12 @@ class WiFiSecurityApp(MDApp):
         self.theme_cls.theme_style = "Light"
         if hasattr(self.theme_cls, "font_styles"):
             self.theme_cls.font_styles["H5"] = ["Roboto", 48, False, 0.15]
+        # Start the first scan now; the Wi‑Fi configuration screen joins it (or reuses its cached
+        # result) when it is entered, instead of starting its own.
+        RequestNetworks(lambda networks: None)
         return Builder.load_string(kv)
 
 # ---------------- Main Execution ----------------
 if __name__ == '__main__':
-    threading.Thread(target=mqttClient.start, daemon=True).start()
+    mqttClient.start()
     WiFiSecurityApp().run()